@@ -2,6 +2,9 @@
 #define ARRAY_SUPPORT_HEADER_H
 
 #include <array>
+#include <memory>
+#include <stdexcept>
+#include <vector>
 
 #include <nanobind/nanobind.h>
 #include <nanobind/ndarray.h>
@@ -72,4 +75,114 @@ NDArray<T, N> MakeNDArray(const std::array<int, N> shape,
   return NDArray<T, N>(data, N, shape_, owner);
 }
 
+/**
+ * Output array of shape ``(rows, Cols)``.
+ *
+ * Written into a caller provided numpy array when one is set and it has
+ * enough rows, otherwise allocated once the number of rows is known.
+ */
+template <typename T, size_t Cols> class OutputArray {
+public:
+  // ``buffer`` must be a writable, C-contiguous ``(n, Cols)`` array of T
+  void SetBuffer(nb::handle buffer) {
+    NDArray<T, 2> arr;
+    if (!nb::try_cast(buffer, arr, false)) {
+      throw nb::type_error("Output arrays must be writable, C-contiguous, "
+                           "two dimensional and of the output's dtype.");
+    }
+    if (arr.shape(1) != Cols) {
+      throw std::invalid_argument("Output array has the wrong number of "
+                                  "columns.");
+    }
+    buffer_ = nb::borrow(buffer);
+    buffer_data_ = arr.data();
+    buffer_rows_ = arr.shape(0);
+  }
+
+  // Use a raw buffer with room for ``rows`` rows
+  void SetBuffer(T *data, size_t rows) {
+    buffer_data_ = data;
+    buffer_rows_ = rows;
+  }
+
+  /**
+   * Take over ``storage`` holding ``rows`` rows of T (e.g. a list loaded by
+   * miniply) instead of copying it. Returns false, leaving ``storage``
+   * untouched, when a caller buffer is set, since the rows must then be
+   * written to that buffer.
+   */
+  bool Adopt(std::vector<uint8_t> &&storage, size_t rows) {
+    if (buffer_data_ != nullptr || storage.size() != rows * Cols * sizeof(T)) {
+      return false;
+    }
+    Reset();
+    adopted_.reset(new std::vector<uint8_t>(std::move(storage)));
+    data_ = reinterpret_cast<T *>(adopted_->data());
+    rows_ = rows;
+    loaded_ = true;
+    return true;
+  }
+
+  T *Allocate(size_t rows) {
+    rows_ = rows;
+    loaded_ = true;
+    adopted_.reset();
+    if (buffer_data_ != nullptr && rows <= buffer_rows_) {
+      owned_.reset();
+      data_ = buffer_data_;
+    } else {
+      owned_.reset(AllocateArray<T>(rows * Cols));
+      data_ = owned_.get();
+    }
+    return data_;
+  }
+
+  void Reset() {
+    owned_.reset();
+    adopted_.reset();
+    data_ = nullptr;
+    rows_ = 0;
+    loaded_ = false;
+  }
+
+  T *data() const { return data_; }
+  // True if the rows were written to the buffer set with ``SetBuffer``
+  bool in_buffer() const {
+    return loaded_ && owned_ == nullptr && adopted_ == nullptr;
+  }
+  size_t rows() const { return rows_; }
+  bool loaded() const { return loaded_; }
+
+  // The loaded rows as a numpy array (a view of the caller's buffer if it was
+  // used), or None if nothing was loaded.
+  nb::object ToPython() {
+    if (!loaded_) {
+      return nb::none();
+    }
+    if (adopted_ != nullptr) {
+      size_t shape[2] = {rows_, Cols};
+      nb::capsule owner(adopted_.release(), [](void *p) noexcept {
+        delete static_cast<std::vector<uint8_t> *>(p);
+      });
+      return nb::cast(NDArray<T, 2>(data_, 2, shape, owner));
+    }
+    if (owned_ == nullptr) {
+      return buffer_[nb::slice((Py_ssize_t)rows_)];
+    }
+    return nb::cast(
+        WrapNDarray<T, 2>(owned_.release(), {(int)rows_, (int)Cols}));
+  }
+
+private:
+  nb::object buffer_;
+  T *buffer_data_ = nullptr;
+  size_t buffer_rows_ = 0;
+
+  std::unique_ptr<T[]> owned_;
+  std::unique_ptr<std::vector<uint8_t>> adopted_;
+  T *data_ = nullptr;
+  size_t rows_ = 0;
+  bool loaded_ = false;
+};
+
 #endif // ARRAY_SUPPORT_HEADER_H
@@ -0,0 +1,169 @@
+#ifndef MAPPED_FILE_HEADER_H
+#define MAPPED_FILE_HEADER_H
+
+#include <algorithm>
+#include <cerrno>
+#include <cstddef>
+#include <cstdint>
+#include <memory>
+
+#ifdef _WIN32
+#ifndef NOMINMAX
+#define NOMINMAX
+#endif
+#include <windows.h>
+#else
+#include <fcntl.h>
+#include <sys/mman.h>
+#include <sys/stat.h>
+#include <unistd.h>
+#endif
+
+/**
+ * Read-only contents of a file: a memory mapping, or a copy in memory.
+ *
+ * The file is only mapped when it is at least ``min_size`` bytes, since for
+ * small files the cost of setting up the mapping outweighs the copy saved.
+ * Smaller files are read into memory through the descriptor that is already
+ * open, so the path is only looked up once. Check ``valid()`` after
+ * construction.
+ *
+ * ``error()`` is non-zero when the file could not be opened or read and holds
+ * the ``errno`` value (or the Windows error code) for that failure.
+ */
+class MappedFile {
+public:
+  MappedFile(const char *filename, size_t min_size = 0) {
+#ifdef _WIN32
+    HANDLE file = CreateFileA(filename, GENERIC_READ, FILE_SHARE_READ, NULL,
+                              OPEN_EXISTING, FILE_FLAG_SEQUENTIAL_SCAN, NULL);
+    if (file == INVALID_HANDLE_VALUE) {
+      error_ = (int)GetLastError();
+      return;
+    }
+    LARGE_INTEGER file_size;
+    if (!GetFileSizeEx(file, &file_size)) {
+      error_ = (int)GetLastError();
+      CloseHandle(file);
+      return;
+    }
+    if ((uint64_t)file_size.QuadPart < min_size || file_size.QuadPart == 0) {
+      ReadAll(file, (size_t)file_size.QuadPart);
+      CloseHandle(file);
+      return;
+    }
+    HANDLE mapping = CreateFileMappingA(file, NULL, PAGE_READONLY, 0, 0, NULL);
+    CloseHandle(file);
+    if (mapping == NULL) {
+      return;
+    }
+    void *data = MapViewOfFile(mapping, FILE_MAP_READ, 0, 0, 0);
+    CloseHandle(mapping);
+    if (data == NULL) {
+      return;
+    }
+    size_ = (size_t)file_size.QuadPart;
+#else
+    int fd = open(filename, O_RDONLY);
+    if (fd < 0) {
+      error_ = errno;
+      return;
+    }
+    struct stat st;
+    if (fstat(fd, &st) != 0) {
+      error_ = errno;
+      close(fd);
+      return;
+    }
+    if (S_ISDIR(st.st_mode)) {
+      error_ = EISDIR;
+      close(fd);
+      return;
+    }
+    if ((size_t)st.st_size < min_size || st.st_size == 0) {
+      ReadAll(fd, (size_t)st.st_size);
+      close(fd);
+      return;
+    }
+    void *data = mmap(NULL, (size_t)st.st_size, PROT_READ, MAP_PRIVATE, fd, 0);
+    close(fd);
+    if (data == MAP_FAILED) {
+      return;
+    }
+    size_ = (size_t)st.st_size;
+#if defined(__linux__) || defined(__APPLE__)
+    // the body is consumed front to back, so let the kernel read ahead
+    madvise(data, size_, MADV_SEQUENTIAL);
+#endif
+#endif
+    data_ = static_cast<const char *>(data);
+    mapped_ = true;
+  }
+
+  ~MappedFile() {
+    if (!mapped_) {
+      return;
+    }
+#ifdef _WIN32
+    UnmapViewOfFile(data_);
+#else
+    munmap(const_cast<char *>(data_), size_);
+#endif
+  }
+
+  MappedFile(const MappedFile &) = delete;
+  MappedFile &operator=(const MappedFile &) = delete;
+
+  // True if the contents are available (mapped or read), even when empty
+  bool valid() const { return data_ != nullptr; }
+  bool mapped() const { return mapped_; }
+  int error() const { return error_; }
+  const char *data() const { return data_; }
+  size_t size() const { return size_; }
+
+private:
+#ifdef _WIN32
+  using Handle = HANDLE;
+#else
+  using Handle = int;
+#endif
+
+  // Read up to ``size`` bytes (fewer if the file shrank) into ``buffer_``
+  void ReadAll(Handle file, size_t size) {
+    buffer_.reset(new char[size > 0 ? size : 1]);
+    size_t done = 0;
+    while (done < size) {
+#ifdef _WIN32
+      DWORD chunk = (DWORD)std::min<size_t>(size - done, 1u << 30u);
+      DWORD n = 0;
+      if (!ReadFile(file, buffer_.get() + done, chunk, &n, NULL)) {
+        error_ = (int)GetLastError();
+        return;
+      }
+#else
+      ssize_t n = read(file, buffer_.get() + done, size - done);
+      if (n < 0) {
+        if (errno == EINTR) {
+          continue;
+        }
+        error_ = errno;
+        return;
+      }
+#endif
+      if (n == 0) {
+        break;
+      }
+      done += (size_t)n;
+    }
+    data_ = buffer_.get();
+    size_ = done;
+  }
+
+  const char *data_ = nullptr;
+  size_t size_ = 0;
+  int error_ = 0;
+  bool mapped_ = false;
+  std::unique_ptr<char[]> buffer_;
+};
+
+#endif // MAPPED_FILE_HEADER_H
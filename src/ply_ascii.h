@@ -0,0 +1,412 @@
+#ifndef PLY_ASCII_HEADER_H
+#define PLY_ASCII_HEADER_H
+
+#include <algorithm>
+#include <cfloat>
+#include <cmath>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <vector>
+
+#include "ply_buffer.h"
+
+// The SWAR digit parsing below assumes little endian loads
+#if defined(__BYTE_ORDER__) && __BYTE_ORDER__ == __ORDER_BIG_ENDIAN__
+#define PYMINIPLY_SWAR_DIGITS 0
+#else
+#define PYMINIPLY_SWAR_DIGITS 1
+#endif
+
+// True if all 8 bytes of ``v`` are ASCII digits
+inline bool IsEightDigits(uint64_t v) {
+  return ((v & 0xF0F0F0F0F0F0F0F0u) |
+          (((v + 0x0606060606060606u) & 0xF0F0F0F0F0F0F0F0u) >> 4)) ==
+         0x3333333333333333u;
+}
+
+// Value of 8 ASCII digits loaded little endian, using three multiplies
+// rather than a loop over the digits
+inline uint32_t ParseEightDigits(uint64_t v) {
+  const uint64_t mask = 0x000000FF000000FFu;
+  const uint64_t mul1 = 0x000F424000000064u; // 100 + (1000000 << 32)
+  const uint64_t mul2 = 0x0000271000000001u; // 1 + (10000 << 32)
+  v -= 0x3030303030303030u;
+  v = (v * 10) + (v >> 8);
+  v = (((v & mask) * mul1) + (((v >> 16) & mask) * mul2)) >> 32;
+  return static_cast<uint32_t>(v);
+}
+
+inline bool IsDigit(char c) { return c >= '0' && c <= '9'; }
+
+inline bool IsSpace(char c) {
+  return c == ' ' || c == '\t' || c == '\r' || c == '\n';
+}
+
+// A decimal number ``(-1)^negative * mantissa * 10^exponent``
+struct Decimal {
+  uint64_t mantissa = 0;
+  int64_t exponent = 0;
+  bool negative = false;
+  bool truncated = false; // digits beyond the 19 ``mantissa`` holds dropped
+};
+
+/**
+ * Accumulate a run of digits into ``dec``, 8 at a time where possible, and
+ * return the number of digits consumed. Digits of the fraction decrement the
+ * exponent. Once the mantissa holds 19 significant digits further digits are
+ * dropped, incrementing the exponent in the integer part.
+ */
+inline size_t ParseDigits(const char *&pos, const char *end, Decimal &dec,
+                          bool fraction) {
+  const char *start = pos;
+#if PYMINIPLY_SWAR_DIGITS
+  while (end - pos >= 8 && dec.mantissa < 100000000000u) {
+    uint64_t v;
+    std::memcpy(&v, pos, 8);
+    if (!IsEightDigits(v)) {
+      break;
+    }
+    dec.mantissa = dec.mantissa * 100000000u + ParseEightDigits(v);
+    dec.exponent -= fraction ? 8 : 0;
+    pos += 8;
+  }
+#endif
+  for (; pos < end && IsDigit(*pos); pos++) {
+    if (dec.mantissa < 1000000000000000000u) {
+      dec.mantissa = dec.mantissa * 10u + static_cast<uint64_t>(*pos - '0');
+      dec.exponent -= fraction ? 1 : 0;
+    } else {
+      dec.truncated = true;
+      dec.exponent += fraction ? 0 : 1;
+    }
+  }
+  return (size_t)(pos - start);
+}
+
+/**
+ * Parse a decimal number (``[+-]digits[.digits][(e|E)[+-]digits]``) ending
+ * at whitespace or ``end``. Returns the end of the number or nullptr if the
+ * text is not a number.
+ */
+inline const char *ParseDecimal(const char *pos, const char *end,
+                                Decimal &dec) {
+  if (pos < end && (*pos == '-' || *pos == '+')) {
+    dec.negative = *pos == '-';
+    pos++;
+  }
+  size_t num_digits = ParseDigits(pos, end, dec, false);
+  if (pos < end && *pos == '.') {
+    pos++;
+    num_digits += ParseDigits(pos, end, dec, true);
+  }
+  if (num_digits == 0) {
+    return nullptr;
+  }
+  if (pos < end && (*pos == 'e' || *pos == 'E')) {
+    pos++;
+    bool negative = false;
+    if (pos < end && (*pos == '-' || *pos == '+')) {
+      negative = *pos == '-';
+      pos++;
+    }
+    if (pos == end || !IsDigit(*pos)) {
+      return nullptr;
+    }
+    int64_t exponent = 0;
+    for (; pos < end && IsDigit(*pos); pos++) {
+      if (exponent < 100000) {
+        exponent = exponent * 10 + (*pos - '0');
+      }
+    }
+    dec.exponent += negative ? -exponent : exponent;
+  }
+  if (pos < end && !IsSpace(*pos)) {
+    return nullptr;
+  }
+  return pos;
+}
+
+// Exact conversion with ``strtod`` for the rare numbers outside the fast
+// paths below. The token is copied so ``strtod`` cannot run past ``end``.
+inline bool SlowParseDouble(const char *start, const char *stop, double &out) {
+  char token[64];
+  size_t len = (size_t)(stop - start);
+  if (len >= sizeof(token)) {
+    return false;
+  }
+  std::memcpy(token, start, len);
+  token[len] = '\0';
+  char *token_end;
+  out = std::strtod(token, &token_end);
+  return token_end == token + len;
+}
+
+inline bool SlowParseFloat(const char *start, const char *stop, float &out) {
+  char token[64];
+  size_t len = (size_t)(stop - start);
+  if (len >= sizeof(token)) {
+    return false;
+  }
+  std::memcpy(token, start, len);
+  token[len] = '\0';
+  char *token_end;
+  out = std::strtof(token, &token_end);
+  return token_end == token + len;
+}
+
+static const double kPow10[] = {1e0,  1e1,  1e2,  1e3,  1e4,  1e5,  1e6,  1e7,
+                                1e8,  1e9,  1e10, 1e11, 1e12, 1e13, 1e14, 1e15,
+                                1e16, 1e17, 1e18, 1e19, 1e20, 1e21, 1e22};
+
+// ``mantissa * 10^exponent`` in double arithmetic, for |exponent| <= 22 where
+// the power of ten is exact
+inline double ScaleDecimal(const Decimal &dec) {
+  double value = (double)dec.mantissa;
+  return dec.exponent < 0 ? value / kPow10[-dec.exponent]
+                          : value * kPow10[dec.exponent];
+}
+
+/**
+ * Correctly rounded double for ``dec`` when both the mantissa and the power
+ * of ten are exact doubles (Clinger's fast path). Returns false otherwise.
+ */
+inline bool FastDouble(const Decimal &dec, double &out) {
+  if (dec.truncated || dec.mantissa > (1ull << 53u) || dec.exponent < -22 ||
+      dec.exponent > 22) {
+    return false;
+  }
+  double value = ScaleDecimal(dec);
+  out = dec.negative ? -value : value;
+  return true;
+}
+
+/**
+ * Correctly rounded float for ``dec``, covering the numbers written by
+ * virtually every PLY exporter, including the 17 significant digits VTK
+ * writes. Returns false for the rest.
+ */
+inline bool FastFloat(const Decimal &dec, float &out) {
+  static const float kPow10f[] = {1e0f, 1e1f, 1e2f, 1e3f, 1e4f, 1e5f,
+                                  1e6f, 1e7f, 1e8f, 1e9f, 1e10f};
+  if (dec.mantissa == 0) {
+    out = dec.negative ? -0.0f : 0.0f;
+    return true;
+  }
+  if (!dec.truncated && dec.mantissa <= (1u << 24u) && dec.exponent >= -10 &&
+      dec.exponent <= 10) {
+    // exact operands, so a single correctly rounded operation
+    float value = (float)dec.mantissa;
+    value = dec.exponent < 0 ? value / kPow10f[-dec.exponent]
+                             : value * kPow10f[dec.exponent];
+    out = dec.negative ? -value : value;
+    return true;
+  }
+  if (dec.exponent < -22 || dec.exponent > 22) {
+    return false;
+  }
+
+  // The double is within a few of its ulps of the exact value (rounding the
+  // mantissa, the power of ten, the product and any dropped digits), which is
+  // far below the precision of a float. Rounding it to float is therefore
+  // correct unless it lies within that error of a point halfway between two
+  // floats.
+  static const double kNegPow10[] = {1e0,   1e-1,  1e-2,  1e-3,  1e-4,  1e-5,
+                                     1e-6,  1e-7,  1e-8,  1e-9,  1e-10, 1e-11,
+                                     1e-12, 1e-13, 1e-14, 1e-15, 1e-16, 1e-17,
+                                     1e-18, 1e-19, 1e-20, 1e-21, 1e-22};
+  // multiplying by the (inexact) reciprocal adds at most another ulp of
+  // error, which the halfway check below allows for
+  double value = (double)dec.mantissa;
+  value *= dec.exponent < 0 ? kNegPow10[-dec.exponent] : kPow10[dec.exponent];
+  if (value < FLT_MIN || value > FLT_MAX) {
+    return false;
+  }
+  uint64_t bits;
+  std::memcpy(&bits, &value, 8);
+  const uint64_t below_float = bits & 0x1FFFFFFFu; // 29 bits dropped
+  if (below_float > 0x10000000u - 16 && below_float < 0x10000000u + 16) {
+    return false;
+  }
+  out = dec.negative ? -(float)value : (float)value;
+  return true;
+}
+
+// Store an integer parsed as a 32 bit value, like miniply, as ``type``
+inline void StoreAsciiInt(int64_t value, PLYPropertyType type, uint8_t *dest) {
+  switch (type) {
+  case PLYPropertyType::Char:
+  case PLYPropertyType::UChar:
+    *dest = static_cast<uint8_t>(value);
+    break;
+  case PLYPropertyType::Short:
+  case PLYPropertyType::UShort: {
+    uint16_t v = static_cast<uint16_t>(value);
+    std::memcpy(dest, &v, 2);
+    break;
+  }
+  default: {
+    uint32_t v = static_cast<uint32_t>(value);
+    std::memcpy(dest, &v, 4);
+  }
+  }
+}
+
+/**
+ * Parse an optionally signed integer of at most 10 digits. Indices and list
+ * counts are by far the most common ASCII integers, so this skips the
+ * fraction and exponent handling of ``ParseDecimal``.
+ */
+inline const char *ParseAsciiInt(const char *pos, const char *end,
+                                 PLYPropertyType type, uint8_t *dest) {
+  bool negative = false;
+  if (pos < end && (*pos == '-' || *pos == '+')) {
+    negative = *pos == '-';
+    pos++;
+  }
+  const char *start = pos;
+  uint64_t value = 0;
+  for (; pos < end && IsDigit(*pos) && pos - start < 10; pos++) {
+    value = value * 10u + static_cast<uint64_t>(*pos - '0');
+  }
+  if (pos == start || value > 0xFFFFFFFFu || (pos < end && !IsSpace(*pos))) {
+    return nullptr;
+  }
+  StoreAsciiInt(negative ? -(int64_t)value : (int64_t)value, type, dest);
+  return pos;
+}
+
+/**
+ * Parse one ASCII value of ``type`` at ``pos`` (after any whitespace) and
+ * store it at ``dest`` as a native binary value. Returns the end of the value
+ * or nullptr if it is not a valid value of that type.
+ */
+inline const char *ParseAsciiValue(const char *pos, const char *end,
+                                   PLYPropertyType type, uint8_t *dest) {
+  while (pos < end && IsSpace(*pos)) {
+    pos++;
+  }
+  if (type < PLYPropertyType::Float) {
+    return ParseAsciiInt(pos, end, type, dest);
+  }
+  const char *start = pos;
+  Decimal dec;
+  pos = ParseDecimal(pos, end, dec);
+  if (pos == nullptr) {
+    return nullptr;
+  }
+
+  if (type == PLYPropertyType::Float) {
+    float value;
+    if (!FastFloat(dec, value) && !SlowParseFloat(start, pos, value)) {
+      return nullptr;
+    }
+    std::memcpy(dest, &value, sizeof(value));
+    return pos;
+  }
+  double value;
+  if (!FastDouble(dec, value) && !SlowParseDouble(start, pos, value)) {
+    return nullptr;
+  }
+  std::memcpy(dest, &value, sizeof(value));
+  return pos;
+}
+
+// Position after the end of the line containing ``pos``
+inline const char *SkipLine(const char *pos, const char *end) {
+  const void *newline = std::memchr(pos, '\n', (size_t)(end - pos));
+  return newline == nullptr ? end : static_cast<const char *>(newline) + 1;
+}
+
+/**
+ * Convert the rows of an ASCII element at ``pos`` to the binary little endian
+ * layout read by the binary decoder, storing them in ``dest``. Each row is
+ * one line, as in miniply. Returns the position after the element or
+ * nullptr if it is malformed or runs past ``end``.
+ */
+inline const uint8_t *AsciiToBinary(const PLYElement &elem, const uint8_t *data,
+                                    const uint8_t *end_,
+                                    std::vector<uint8_t> &dest) {
+  const char *pos = reinterpret_cast<const char *>(data);
+  const char *end = reinterpret_cast<const char *>(end_);
+
+  if (elem.fixedSize) {
+    dest.resize((size_t)elem.count * elem.rowStride);
+    uint8_t *row_data = dest.data();
+    for (uint32_t row = 0; row < elem.count; row++) {
+      for (const PLYProperty &prop : elem.properties) {
+        pos = ParseAsciiValue(pos, end, prop.type, row_data + prop.offset);
+        if (pos == nullptr) {
+          return nullptr;
+        }
+      }
+      pos = SkipLine(pos, end);
+      row_data += elem.rowStride;
+    }
+    return reinterpret_cast<const uint8_t *>(pos);
+  }
+
+  // variable size rows are appended value by value, growing ``dest`` ahead
+  // of each list rather than per value
+  size_t used = 0;
+  dest.resize((size_t)elem.count * 16u);
+  uint8_t value[8];
+  for (uint32_t row = 0; row < elem.count; row++) {
+    for (const PLYProperty &prop : elem.properties) {
+      uint32_t count = 1;
+      if (prop.countType != PLYPropertyType::None) {
+        if (prop.countType == PLYPropertyType::Float ||
+            prop.countType == PLYPropertyType::Double) {
+          return nullptr;
+        }
+        pos = ParseAsciiValue(pos, end, prop.countType, value);
+        if (pos == nullptr) {
+          return nullptr;
+        }
+        int64_t signed_count = ReadValue<int64_t>(value, prop.countType);
+        if (signed_count < 0) {
+          return nullptr;
+        }
+        count = (uint32_t)signed_count;
+      }
+      const uint32_t count_bytes = prop.countType == PLYPropertyType::None
+                                       ? 0
+                                       : PropertySize(prop.countType);
+      const uint32_t value_bytes = PropertySize(prop.type);
+      const size_t needed = count_bytes + (size_t)count * value_bytes;
+      if (used + needed > dest.size()) {
+        dest.resize(std::max(used + needed, dest.size() * 2));
+      }
+      std::memcpy(dest.data() + used, value, count_bytes);
+      used += count_bytes;
+      for (uint32_t i = 0; i < count; i++) {
+        pos = ParseAsciiValue(pos, end, prop.type, dest.data() + used);
+        if (pos == nullptr) {
+          return nullptr;
+        }
+        used += value_bytes;
+      }
+    }
+    pos = SkipLine(pos, end);
+  }
+  dest.resize(used);
+  return reinterpret_cast<const uint8_t *>(pos);
+}
+
+// Return the end of an ASCII element's rows, or nullptr if it runs past
+// ``end``
+inline const uint8_t *SkipAsciiElement(const PLYElement &elem,
+                                       const uint8_t *data,
+                                       const uint8_t *end_) {
+  const char *pos = reinterpret_cast<const char *>(data);
+  const char *end = reinterpret_cast<const char *>(end_);
+  for (uint32_t row = 0; row < elem.count; row++) {
+    if (pos == end) {
+      return nullptr;
+    }
+    pos = SkipLine(pos, end);
+  }
+  return reinterpret_cast<const uint8_t *>(pos);
+}
+
+#endif // PLY_ASCII_HEADER_H
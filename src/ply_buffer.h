@@ -0,0 +1,722 @@
+#ifndef PLY_BUFFER_HEADER_H
+#define PLY_BUFFER_HEADER_H
+
+#include <algorithm>
+#include <cstdint>
+#include <cstdlib>
+#include <cstring>
+#include <string>
+#include <vector>
+
+#include "miniply/miniply.h"
+#include "simd.h"
+
+using miniply::PLYElement;
+using miniply::PLYFileType;
+using miniply::PLYProperty;
+using miniply::PLYPropertyType;
+
+// Size in bytes of each PLYPropertyType, indexed by the enum value
+inline uint32_t PropertySize(PLYPropertyType type) {
+  static const uint32_t sizes[] = {1, 1, 2, 2, 4, 4, 4, 8};
+  return sizes[uint32_t(type)];
+}
+
+// PLYPropertyType matching a C++ type
+template <typename T> struct PropertyTypeOf;
+template <> struct PropertyTypeOf<uint8_t> {
+  static constexpr PLYPropertyType value = PLYPropertyType::UChar;
+};
+template <> struct PropertyTypeOf<int> {
+  static constexpr PLYPropertyType value = PLYPropertyType::Int;
+};
+template <> struct PropertyTypeOf<float> {
+  static constexpr PLYPropertyType value = PLYPropertyType::Float;
+};
+
+// True when values of ``src`` can be copied bitwise into ``dest``
+inline bool CompatibleTypes(PLYPropertyType src, PLYPropertyType dest) {
+  return src == dest || (src < PLYPropertyType::Float &&
+                         (uint32_t(src) ^ 0x1) == uint32_t(dest));
+}
+
+// Read a single (possibly unaligned) value and convert it to T
+template <typename T>
+inline T ReadValue(const uint8_t *src, PLYPropertyType type) {
+  switch (type) {
+  case PLYPropertyType::Char: {
+    int8_t v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::UChar:
+    return static_cast<T>(*src);
+  case PLYPropertyType::Short: {
+    int16_t v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::UShort: {
+    uint16_t v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::Int: {
+    int32_t v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::UInt: {
+    uint32_t v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::Float: {
+    float v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  case PLYPropertyType::Double: {
+    double v;
+    std::memcpy(&v, src, sizeof(v));
+    return static_cast<T>(v);
+  }
+  default:
+    return T(0);
+  }
+}
+
+/**
+ * PLY file held entirely in memory (for example, a memory mapped file).
+ *
+ * Only the header is parsed on construction. Element descriptors use
+ * miniply's types so the property lookup helpers in ``PLYElement`` can be
+ * reused, and the binary body is then decoded directly from the buffer
+ * without going through miniply's read buffer.
+ */
+class PLYBuffer {
+public:
+  PLYBuffer(const char *data, size_t size)
+      : data_(reinterpret_cast<const uint8_t *>(data)), size_(size) {
+    valid_ = ParseHeader();
+    if (valid_) {
+      for (PLYElement &elem : elements_) {
+        elem.calculate_offsets();
+      }
+    }
+  }
+
+  bool valid() const { return valid_; }
+  PLYFileType file_type() const { return file_type_; }
+  const std::vector<PLYElement> &elements() const { return elements_; }
+
+  // start of the element data, immediately after the header
+  const uint8_t *body() const { return data_ + body_offset_; }
+  const uint8_t *end() const { return data_ + size_; }
+
+private:
+  bool ParseHeader() {
+    std::vector<std::string> tokens;
+    size_t pos = 0;
+    bool first_line = true;
+
+    while (NextLine(pos, tokens)) {
+      if (first_line) {
+        if (tokens.size() != 1 || tokens[0] != "ply") {
+          return false;
+        }
+        first_line = false;
+        continue;
+      }
+      if (tokens.empty() || tokens[0] == "comment" || tokens[0] == "obj_info") {
+        continue;
+      }
+
+      const std::string &keyword = tokens[0];
+      if (keyword == "format") {
+        if (tokens.size() != 3) {
+          return false;
+        }
+        if (tokens[1] == "ascii") {
+          file_type_ = PLYFileType::ASCII;
+        } else if (tokens[1] == "binary_little_endian") {
+          file_type_ = PLYFileType::Binary;
+        } else if (tokens[1] == "binary_big_endian") {
+          file_type_ = PLYFileType::BinaryBigEndian;
+        } else {
+          return false;
+        }
+      } else if (keyword == "element") {
+        if (tokens.size() != 3) {
+          return false;
+        }
+        elements_.emplace_back();
+        elements_.back().name = tokens[1];
+        elements_.back().count =
+            (uint32_t)std::strtoul(tokens[2].c_str(), NULL, 10);
+      } else if (keyword == "property") {
+        if (elements_.empty()) {
+          return false;
+        }
+        PLYProperty prop;
+        if (tokens.size() == 3) {
+          prop.type = LookupType(tokens[1]);
+        } else if (tokens.size() == 5 && tokens[1] == "list") {
+          prop.countType = LookupType(tokens[2]);
+          prop.type = LookupType(tokens[3]);
+          if (prop.countType == PLYPropertyType::None ||
+              prop.countType >= PLYPropertyType::Float) {
+            return false;
+          }
+        } else {
+          return false;
+        }
+        if (prop.type == PLYPropertyType::None) {
+          return false;
+        }
+        prop.name = tokens.back();
+        elements_.back().properties.push_back(std::move(prop));
+      } else if (keyword == "end_header") {
+        body_offset_ = pos;
+        return true;
+      } else {
+        return false;
+      }
+    }
+    return false;
+  }
+
+  // Split the line starting at ``pos`` into whitespace separated tokens and
+  // advance ``pos`` past its newline.
+  bool NextLine(size_t &pos, std::vector<std::string> &tokens) const {
+    const uint8_t *nl = static_cast<const uint8_t *>(
+        std::memchr(data_ + pos, '\n', size_ - pos));
+    if (nl == nullptr) {
+      return false;
+    }
+    tokens.clear();
+    const char *ch = reinterpret_cast<const char *>(data_ + pos);
+    const char *line_end = reinterpret_cast<const char *>(nl);
+    while (ch < line_end) {
+      while (ch < line_end && (*ch == ' ' || *ch == '\t' || *ch == '\r')) {
+        ++ch;
+      }
+      const char *start = ch;
+      while (ch < line_end && *ch != ' ' && *ch != '\t' && *ch != '\r') {
+        ++ch;
+      }
+      if (ch > start) {
+        tokens.emplace_back(start, ch);
+      }
+    }
+    pos = (size_t)(nl - data_) + 1;
+    return true;
+  }
+
+  static PLYPropertyType LookupType(const std::string &name) {
+    static const struct {
+      const char *name;
+      PLYPropertyType type;
+    } aliases[] = {
+        {"char", PLYPropertyType::Char},
+        {"uchar", PLYPropertyType::UChar},
+        {"short", PLYPropertyType::Short},
+        {"ushort", PLYPropertyType::UShort},
+        {"int", PLYPropertyType::Int},
+        {"uint", PLYPropertyType::UInt},
+        {"float", PLYPropertyType::Float},
+        {"double", PLYPropertyType::Double},
+        {"int8", PLYPropertyType::Char},
+        {"uint8", PLYPropertyType::UChar},
+        {"int16", PLYPropertyType::Short},
+        {"uint16", PLYPropertyType::UShort},
+        {"int32", PLYPropertyType::Int},
+        {"uint32", PLYPropertyType::UInt},
+        {"float32", PLYPropertyType::Float},
+        {"float64", PLYPropertyType::Double},
+    };
+    for (const auto &alias : aliases) {
+      if (name == alias.name) {
+        return alias.type;
+      }
+    }
+    return PLYPropertyType::None;
+  }
+
+  const uint8_t *data_;
+  size_t size_;
+  size_t body_offset_ = 0;
+  bool valid_ = false;
+  PLYFileType file_type_ = PLYFileType::ASCII;
+  std::vector<PLYElement> elements_;
+};
+
+// Read a single value stored in big endian byte order and convert it to T
+template <typename T>
+inline T ReadValueSwapped(const uint8_t *src, PLYPropertyType type) {
+  uint8_t value[8];
+  SwapBytes(src, 1, PropertySize(type), value);
+  return ReadValue<T>(value, type);
+}
+
+// Copy ``Bytes`` bytes from each of ``num_rows`` rows ``stride`` bytes apart;
+// the fixed size lets the compiler inline each copy as plain loads and stores.
+template <size_t Bytes>
+void CopyRows(const uint8_t *from, size_t stride, size_t num_rows,
+              uint8_t *dest) {
+  for (size_t row = 0; row < num_rows; row++) {
+    std::memcpy(dest, from, Bytes);
+    from += stride;
+    dest += Bytes;
+  }
+}
+
+// Copy a block of ``bytes`` bytes from each of ``num_rows`` rows ``stride``
+// bytes apart into ``dest``
+inline void CopyColumnBlock(const uint8_t *from, size_t stride, size_t num_rows,
+                            size_t bytes, uint8_t *dest) {
+  switch (bytes) {
+  case 3:
+    GatherRGB(from, stride, num_rows, dest);
+    break;
+  case 8:
+    CopyRows<8>(from, stride, num_rows, dest);
+    break;
+  case 12:
+    PackRows12(from, stride, num_rows, dest);
+    break;
+  default:
+    for (size_t row = 0; row < num_rows; row++) {
+      std::memcpy(dest, from, bytes);
+      from += stride;
+      dest += bytes;
+    }
+  }
+}
+
+// True when the properties ``prop_idxs`` are stored back to back in each row
+// as T, i.e. they can be copied as one block per row. ``offset`` is set to
+// the offset of the block within the row.
+template <typename T>
+bool NativeColumns(const PLYElement &elem, const uint32_t prop_idxs[],
+                   uint32_t num_props, uint32_t *offset) {
+  *offset = elem.properties[prop_idxs[0]].offset;
+  uint32_t expected = *offset;
+  for (uint32_t i = 0; i < num_props; i++) {
+    const PLYProperty &prop = elem.properties[prop_idxs[i]];
+    if (!CompatibleTypes(prop.type, PropertyTypeOf<T>::value) ||
+        prop.offset != expected) {
+      return false;
+    }
+    expected = prop.offset + PropertySize(prop.type);
+  }
+  return true;
+}
+
+/**
+ * Copy the properties ``prop_idxs`` of ``num_rows`` rows of a fixed size
+ * binary element into ``dest``, converting to T as required.
+ *
+ * Mirrors ``PLYReader::extract_properties``: a single memcpy when the rows
+ * contain only the requested columns, a memcpy per row when the columns are
+ * contiguous and need no conversion, and a per-value conversion otherwise.
+ */
+template <typename T>
+void ExtractColumns(const PLYElement &elem, const uint8_t *rows,
+                    size_t num_rows, const uint32_t prop_idxs[],
+                    uint32_t num_props, T *dest) {
+  const size_t stride = elem.rowStride;
+
+  uint32_t first;
+  if (NativeColumns<T>(elem, prop_idxs, num_props, &first)) {
+    const size_t row_bytes = num_props * sizeof(T);
+    if (first == 0 && row_bytes == stride) {
+      std::memcpy(dest, rows, num_rows * stride);
+      return;
+    }
+    CopyColumnBlock(rows + first, stride, num_rows, row_bytes,
+                    reinterpret_cast<uint8_t *>(dest));
+    return;
+  }
+
+  for (size_t row = 0; row < num_rows; row++) {
+    const uint8_t *from = rows + row * stride;
+    for (uint32_t i = 0; i < num_props; i++) {
+      const PLYProperty &prop = elem.properties[prop_idxs[i]];
+      *dest++ = ReadValue<T>(from + prop.offset, prop.type);
+    }
+  }
+}
+
+/**
+ * Extract several groups of columns (e.g. positions, normals and colors) from
+ * a fixed size binary element.
+ *
+ * When every group can be copied as one block per row, the rows are
+ * processed in small batches with all groups copied from each batch while it
+ * is still in L1, so the element is streamed from memory once instead of once
+ * per group. Otherwise each group is extracted separately with
+ * ``ExtractColumns``.
+ *
+ * When built with OpenMP, large elements are split into contiguous row
+ * ranges that are extracted in parallel, each into its own rows of the
+ * outputs.
+ */
+class ColumnExtractor {
+public:
+  explicit ColumnExtractor(const PLYElement &elem) : elem_(elem) {}
+
+  template <typename T>
+  void Add(const uint32_t prop_idxs[], uint32_t num_props, T *dest) {
+    Group group;
+    std::copy(prop_idxs, prop_idxs + num_props, group.prop_idxs);
+    group.num_props = num_props;
+    group.bytes = num_props * sizeof(T);
+    group.dest = reinterpret_cast<uint8_t *>(dest);
+    group.native = NativeColumns<T>(elem_, prop_idxs, num_props, &group.offset);
+    group.extract = [](const PLYElement &elem, const uint8_t *rows,
+                       size_t num_rows, const Group &g, uint8_t *dest) {
+      ExtractColumns(elem, rows, num_rows, g.prop_idxs, g.num_props,
+                     reinterpret_cast<T *>(dest));
+    };
+    groups_.push_back(group);
+  }
+
+  // True when every group is copied without conversion, as required to
+  // extract big endian rows with ``swap``
+  bool native() const {
+    for (const Group &group : groups_) {
+      if (!group.native) {
+        return false;
+      }
+    }
+    return true;
+  }
+
+  // Extract every row, using up to ``num_threads`` threads. With ``swap``
+  // the byte order of the extracted values is reversed while they are still
+  // in cache, which reads big endian rows when ``native()``.
+  void Extract(const uint8_t *rows, int num_threads = 1,
+               bool swap = false) const {
+    const size_t count = elem_.count;
+    int num_chunks = 1;
+#ifdef _OPENMP
+    // at least kParallelBytes of rows per thread, to amortize starting them
+    const size_t max_chunks = count * elem_.rowStride / kParallelBytes;
+    num_chunks = (int)std::max<size_t>(
+        std::min<size_t>((size_t)std::max(num_threads, 1), max_chunks), 1);
+#pragma omp parallel for schedule(static)                                      \
+    num_threads(num_chunks) if (num_chunks > 1)
+#else
+    (void)num_threads;
+#endif
+    for (int chunk = 0; chunk < num_chunks; chunk++) {
+      const size_t first = count * chunk / num_chunks;
+      const size_t last = count * (chunk + 1) / num_chunks;
+      ExtractRows(rows, first, last - first, swap);
+    }
+  }
+
+private:
+  static constexpr size_t kBatchBytes = 16384;
+  static constexpr size_t kParallelBytes = 1u << 20u; // 1MB
+
+  struct Group {
+    uint32_t prop_idxs[3];
+    uint32_t num_props;
+    uint32_t offset;
+    uint32_t bytes;
+    bool native;
+    uint8_t *dest;
+    void (*extract)(const PLYElement &, const uint8_t *, size_t, const Group &,
+                    uint8_t *);
+  };
+
+  // Extract ``num_rows`` rows starting at row ``first``. The SIMD kernels
+  // only write within the rows they are given, so ranges can run
+  // concurrently.
+  void ExtractRows(const uint8_t *rows, size_t first, size_t num_rows,
+                   bool swap) const {
+    const size_t stride = elem_.rowStride;
+    rows += first * stride;
+
+    bool fuse = groups_.size() > 1;
+    for (const Group &group : groups_) {
+      fuse = fuse && group.native;
+    }
+    if (!fuse) {
+      for (const Group &group : groups_) {
+        uint8_t *dest = group.dest + first * group.bytes;
+        group.extract(elem_, rows, num_rows, group, dest);
+        if (swap) {
+          SwapGroup(group, dest, num_rows);
+        }
+      }
+      return;
+    }
+
+    const size_t batch = std::max<size_t>(kBatchBytes / stride, 1);
+    for (size_t row = 0; row < num_rows; row += batch) {
+      const size_t batch_rows = std::min<size_t>(batch, num_rows - row);
+      const uint8_t *from = rows + row * stride;
+      for (const Group &group : groups_) {
+        uint8_t *dest = group.dest + (first + row) * group.bytes;
+        CopyColumnBlock(from + group.offset, stride, batch_rows, group.bytes,
+                        dest);
+        if (swap) {
+          SwapGroup(group, dest, batch_rows);
+        }
+      }
+    }
+  }
+
+  static void SwapGroup(const Group &group, uint8_t *dest, size_t num_rows) {
+    SwapBytes(dest, num_rows * group.num_props, group.bytes / group.num_props,
+              dest);
+  }
+
+  const PLYElement &elem_;
+  std::vector<Group> groups_;
+};
+
+// Layout of a binary list property (e.g. face vertex indices)
+struct FaceList {
+  uint32_t num_triangles = 0;
+  bool triangles_only = true; // every row has exactly three entries
+  bool packed = false;        // rows are {uchar 3, int32 a, int32 b, int32 c}
+  const uint8_t *end = nullptr;
+};
+
+// Walk every row of a variable size binary element, calling
+// ``fn(count, data)`` for the list property ``list_idx``. Returns the end of
+// the element data or nullptr if it runs past ``end``. ``swap`` reads the
+// list counts as big endian.
+template <typename Fn>
+const uint8_t *ForEachListRow(const PLYElement &elem, uint32_t list_idx,
+                              const uint8_t *pos, const uint8_t *end, Fn &&fn,
+                              bool swap = false) {
+  for (uint32_t row = 0; row < elem.count; row++) {
+    for (uint32_t i = 0; i < elem.properties.size(); i++) {
+      const PLYProperty &prop = elem.properties[i];
+      size_t num_bytes = PropertySize(prop.type);
+      int64_t count = 1;
+      if (prop.countType != PLYPropertyType::None) {
+        size_t count_bytes = PropertySize(prop.countType);
+        if (count_bytes > (size_t)(end - pos)) {
+          return nullptr;
+        }
+        count = swap ? ReadValueSwapped<int64_t>(pos, prop.countType)
+                     : ReadValue<int64_t>(pos, prop.countType);
+        if (count < 0) {
+          return nullptr;
+        }
+        pos += count_bytes;
+        num_bytes *= (size_t)count;
+      }
+      if (num_bytes > (size_t)(end - pos)) {
+        return nullptr;
+      }
+      if (i == list_idx) {
+        fn((uint32_t)count, pos);
+      }
+      pos += num_bytes;
+    }
+  }
+  return pos;
+}
+
+// Property lookups matching ``PLYReader::find_pos`` and friends
+inline bool FindPos(const PLYElement &elem, uint32_t idxs[3]) {
+  return elem.find_properties(idxs, 3, "x", "y", "z");
+}
+
+inline bool FindNormal(const PLYElement &elem, uint32_t idxs[3]) {
+  return elem.find_properties(idxs, 3, "nx", "ny", "nz");
+}
+
+inline bool FindTexcoord(const PLYElement &elem, uint32_t idxs[2]) {
+  return elem.find_properties(idxs, 2, "u", "v") ||
+         elem.find_properties(idxs, 2, "s", "t") ||
+         elem.find_properties(idxs, 2, "texture_u", "texture_v") ||
+         elem.find_properties(idxs, 2, "texture_s", "texture_t");
+}
+
+inline bool FindColor(const PLYElement &elem, uint32_t idxs[3]) {
+  return elem.find_properties(idxs, 3, "r", "g", "b") ||
+         elem.find_properties(idxs, 3, "red", "green", "blue");
+}
+
+inline bool FindIndices(const PLYElement &elem, uint32_t idxs[1]) {
+  return elem.find_properties(idxs, 1, "vertex_indices") ||
+         elem.find_properties(idxs, 1, "vertex_index");
+}
+
+// Return the end of a binary element's data starting at ``pos``, or nullptr
+// if it runs past ``end``. ``swap`` reads big endian list counts.
+inline const uint8_t *SkipElement(const PLYElement &elem, const uint8_t *pos,
+                                  const uint8_t *end, bool swap = false) {
+  if (elem.fixedSize) {
+    size_t num_bytes = (size_t)elem.count * elem.rowStride;
+    return num_bytes <= (size_t)(end - pos) ? pos + num_bytes : nullptr;
+  }
+  return ForEachListRow(
+      elem, miniply::kInvalidIndex, pos, end, [](uint32_t, const uint8_t *) {},
+      swap);
+}
+
+/**
+ * Copy the rows of a big endian binary element at ``pos`` to ``dest`` in
+ * little endian byte order, so they can be decoded like any other binary
+ * element. Returns the end of the element or nullptr if it runs past
+ * ``end``.
+ */
+inline const uint8_t *SwapElement(const PLYElement &elem, const uint8_t *pos,
+                                  const uint8_t *end,
+                                  std::vector<uint8_t> &dest) {
+  const uint8_t *elem_end = SkipElement(elem, pos, end, true);
+  if (elem_end == nullptr) {
+    return nullptr;
+  }
+  dest.resize((size_t)(elem_end - pos));
+  uint8_t *out = dest.data();
+
+  if (elem.fixedSize) {
+    // rows of one value size (e.g. all floats) are a single run of values
+    uint32_t value_bytes = PropertySize(elem.properties[0].type);
+    for (const PLYProperty &prop : elem.properties) {
+      value_bytes = PropertySize(prop.type) == value_bytes ? value_bytes : 0;
+    }
+    if (value_bytes != 0) {
+      SwapBytes(pos, dest.size() / value_bytes, value_bytes, out);
+      return elem_end;
+    }
+    for (uint32_t row = 0; row < elem.count; row++) {
+      for (const PLYProperty &prop : elem.properties) {
+        SwapBytes(pos + prop.offset, 1, PropertySize(prop.type),
+                  out + prop.offset);
+      }
+      pos += elem.rowStride;
+      out += elem.rowStride;
+    }
+    return elem_end;
+  }
+
+  for (uint32_t row = 0; row < elem.count; row++) {
+    for (const PLYProperty &prop : elem.properties) {
+      size_t count = 1;
+      if (prop.countType != PLYPropertyType::None) {
+        const uint32_t count_bytes = PropertySize(prop.countType);
+        count = (size_t)ReadValueSwapped<int64_t>(pos, prop.countType);
+        SwapBytes(pos, 1, count_bytes, out);
+        pos += count_bytes;
+        out += count_bytes;
+      }
+      const uint32_t value_bytes = PropertySize(prop.type);
+      SwapBytes(pos, count, value_bytes, out);
+      pos += count * value_bytes;
+      out += count * value_bytes;
+    }
+  }
+  return elem_end;
+}
+
+/**
+ * Detect the overwhelmingly common layout of a face element holding only a
+ * uchar counted list of 32-bit indices where every face is a triangle, so
+ * rows have a fixed 13 byte stride. The counts are single bytes, so this
+ * works in either byte order.
+ */
+inline bool ScanPackedTriangles(const PLYElement &elem, uint32_t list_idx,
+                                const uint8_t *pos, const uint8_t *end,
+                                FaceList &info) {
+  const PLYProperty &prop = elem.properties[list_idx];
+  if (elem.properties.size() != 1 || PropertySize(prop.countType) != 1 ||
+      !CompatibleTypes(prop.type, PLYPropertyType::Int) ||
+      (size_t)elem.count * 13 > (size_t)(end - pos)) {
+    return false;
+  }
+  uint8_t mismatch = 0;
+  for (size_t row = 0; row < elem.count; row++) {
+    mismatch |= pos[row * 13] ^ 3;
+  }
+  if (mismatch != 0) {
+    return false;
+  }
+  info.num_triangles = elem.count;
+  info.packed = true;
+  info.end = pos + (size_t)elem.count * 13;
+  return true;
+}
+
+// Count the triangles in a list property, returning false on a truncated file
+inline bool ScanFaceList(const PLYElement &elem, uint32_t list_idx,
+                         const uint8_t *pos, const uint8_t *end,
+                         FaceList &info) {
+  if (ScanPackedTriangles(elem, list_idx, pos, end, info)) {
+    return true;
+  }
+
+  info.end = ForEachListRow(
+      elem, list_idx, pos, end, [&](uint32_t count, const uint8_t *) {
+        if (count >= 3) {
+          info.num_triangles += count - 2;
+        }
+        info.triangles_only = info.triangles_only && count == 3;
+      });
+  return info.end != nullptr;
+}
+
+/**
+ * Write the ``poly.size() - 2`` triangles of a polygon with more than three
+ * vertices to ``dest`` and return the position after them. A polygon miniply
+ * cannot triangulate (an index out of range) is written as degenerate
+ * triangles of vertex 0, so that every row sized for it is defined.
+ */
+template <typename T>
+T *TriangulatePolygon(const std::vector<int> &poly, const float *verts,
+                      uint32_t num_verts, std::vector<int> &tris, T *dest) {
+  tris.resize(3 * (poly.size() - 2));
+  // miniply returns one triangle for any valid polygon with more than four
+  // vertices although all of them are written, so only its failure (zero)
+  // is taken from the return value
+  if (miniply::triangulate_polygon((uint32_t)poly.size(), verts, num_verts,
+                                   poly.data(), tris.data()) == 0) {
+    return std::fill_n(dest, tris.size(), T(0));
+  }
+  return std::copy(tris.begin(), tris.end(), dest);
+}
+
+/**
+ * Write the triangle indices of a list property to ``dest``, triangulating
+ * polygons with more than three vertices the same way miniply does.
+ */
+template <typename T>
+void ExtractFaceList(const PLYElement &elem, uint32_t list_idx,
+                     const uint8_t *pos, const uint8_t *end, const float *verts,
+                     uint32_t num_verts, const FaceList &info, T *dest) {
+  if (info.packed) {
+    PackTriangles(pos, elem.count, dest);
+    return;
+  }
+
+  const PLYPropertyType type = elem.properties[list_idx].type;
+  const uint32_t value_bytes = PropertySize(type);
+  std::vector<int> poly, tris;
+  ForEachListRow(
+      elem, list_idx, pos, end, [&](uint32_t count, const uint8_t *data) {
+        if (count == 3) {
+          dest[0] = ReadValue<T>(data, type);
+          dest[1] = ReadValue<T>(data + value_bytes, type);
+          dest[2] = ReadValue<T>(data + 2 * value_bytes, type);
+          dest += 3;
+        } else if (count > 3) {
+          poly.resize(count);
+          for (uint32_t i = 0; i < count; i++) {
+            poly[i] = ReadValue<int>(data + i * value_bytes, type);
+          }
+          dest = TriangulatePolygon(poly, verts, num_verts, tris, dest);
+        }
+      });
+}
+
+#endif // PLY_BUFFER_HEADER_H
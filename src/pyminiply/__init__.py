@@ -2,7 +2,7 @@
 
 from importlib.metadata import PackageNotFoundError, version
 
-from pyminiply.reader import read, read_as_mesh  # noqa: F401
+from pyminiply.reader import read, read_as_mesh, read_into_numba  # noqa: F401
 
 try:
     __version__ = version("pyminiply")
@@ -10,4 +10,4 @@ except PackageNotFoundError:
     __version__ = "unknown"
 
 
-__all__ = ["read", "read_as_mesh", "__version__"]
+__all__ = ["read", "read_as_mesh", "read_into_numba", "__version__"]
@@ -1,10 +1,57 @@
 """Python wrapper of the miniply library."""
 
 import os
+import tempfile
 
 import numpy as np
 
-from pyminiply._wrapper import load_ply
+from pyminiply._wrapper import fill_offsets, load_ply, load_ply_buffer, read_into_address
+
+_OUT_KEYS = ("vertices", "indices", "normals", "uv", "color")
+
+# pyvista and VTK objects used to build meshes, filled on first use
+_PV = {}
+
+
+def _lazy_pyvista():
+    """Return the cached pyvista and VTK objects, importing them on first use.
+
+    Raises a helpful error when pyvista is missing.
+
+    """
+    if not _PV:
+        try:
+            import pyvista as pv
+        except ModuleNotFoundError:
+            raise ModuleNotFoundError(
+                "To use this functionality, install PyVista with\n\npip install pyvista"
+            )
+        from vtkmodules.util.numpy_support import numpy_to_vtk, vtk_to_numpy
+        from vtkmodules.vtkCommonCore import vtkIdTypeArray
+        from vtkmodules.vtkCommonDataModel import vtkCellArray
+
+        _PV.update(
+            PolyData=pv.PolyData,
+            ID_TYPE=pv.ID_TYPE,
+            vtkCellArray=vtkCellArray,
+            vtkIdTypeArray=vtkIdTypeArray,
+            vtk_to_numpy=vtk_to_numpy,
+            numpy_to_vtk=numpy_to_vtk,
+        )
+    return _PV
+
+
+def _new_idarr(size):
+    """Return a new ``vtkIdTypeArray`` of ``size`` values and a writable view of it.
+
+    The VTK array owns its memory, so it stays valid independently of any numpy
+    array used to fill it.
+
+    """
+    pv = _lazy_pyvista()
+    idarr = pv["vtkIdTypeArray"]()
+    idarr.SetNumberOfValues(size)
+    return idarr, pv["vtk_to_numpy"](idarr)
 
 
 def _polydata_from_faces(points, faces):
@@ -21,41 +68,123 @@ def _polydata_from_faces(points, faces):
         ``(n, 3)`` faces array.
 
     """
-    try:
-        import pyvista as pv
-    except ModuleNotFoundError:
-        raise ModuleNotFoundError(
-            "To use this functionality, install PyVista with\n\npip install pyvista"
-        )
-
-    from pyvista import ID_TYPE
-
-    try:
-        from pyvista.core.utilities import numpy_to_idarr
-    except ModuleNotFoundError:  # pragma: no cover
-        from pyvista.utilities.cells import numpy_to_idarr
-    from vtkmodules.vtkCommonDataModel import vtkCellArray
+    pv = _lazy_pyvista()
 
     if faces.ndim != 2:
         raise ValueError("Expected a two dimensional face array.")
 
-    pdata = pv.PolyData()
+    pdata = pv["PolyData"]()
+    pdata.points = points
+
+    # write the offsets and connectivity straight into VTK owned arrays rather
+    # than building (and casting) them in numpy and then deep copying them
+    n_faces = faces.shape[0]
+    offset, offset_view = _new_idarr(n_faces + 1)
+    fill_offsets(offset_view, faces.shape[1])
+    connectivity, connectivity_view = _new_idarr(faces.size)
+    # a plain memcpy when the faces were read with ``index_dtype=ID_TYPE``
+    connectivity_view[:] = faces.ravel()
+
+    carr = pv["vtkCellArray"]()
+    carr.SetData(offset, connectivity)
+    pdata.SetPolys(carr)
+    return pdata
+
+
+def _polydata_from_triangles(points, triangles):
+    """Generate a polydata from an ``(n, 3)`` triangle array.
+
+    Specialization of :func:`_polydata_from_faces` for triangles. VTK builds
+    the offsets of the fixed size cells itself, so no offset array is created
+    in Python, and triangles of ``pyvista.ID_TYPE`` are shared with VTK rather
+    than copied, so they must not be modified afterwards.
+
+    Parameters
+    ----------
+    points : np.ndarray
+        Points array.
+    triangles : np.ndarray
+        ``(n, 3)`` triangle indices.
+
+    """
+    pv = _lazy_pyvista()
+
+    if triangles.ndim != 2 or triangles.shape[1] != 3:
+        raise ValueError("Expected an (n, 3) triangle array.")
+
+    pdata = pv["PolyData"]()
     pdata.points = points
 
-    carr = vtkCellArray()
-    offset = np.arange(0, faces.size + 1, faces.shape[1], dtype=ID_TYPE)
-    carr.SetData(numpy_to_idarr(offset, deep=True), numpy_to_idarr(faces, deep=True))
+    shared = triangles.dtype == pv["ID_TYPE"] and triangles.flags.c_contiguous
+    if shared:
+        connectivity = pv["numpy_to_vtk"](triangles.ravel(), deep=False)
+    else:
+        connectivity, connectivity_view = _new_idarr(triangles.size)
+        connectivity_view[:] = triangles.ravel()
+
+    carr = pv["vtkCellArray"]()
+    if not carr.SetData(3, connectivity):
+        raise RuntimeError("Failed to set the triangle connectivity.")
+    if shared:
+        # The cell array may store the connectivity as a shallow copy of the
+        # wrapping array, so keep the triangles alive through the array it
+        # actually holds (VTK preserves the attributes of its Python objects)
+        carr.GetConnectivityArray()._numpy_reference = triangles
     pdata.SetPolys(carr)
     return pdata
 
 
-def read(filename, read_normals=True, read_uv=True, read_color=True):
+def _read_buffer(file, *args):
+    """Read a PLY file held in memory or in a file-like object.
+
+    File-like objects are consumed: they are read from their current position
+    to the end and left positioned at the end. The data is decoded straight
+    from memory. Files laid out in a way the decoder does not handle are
+    written to a temporary file and read by miniply.
+
+    """
+    if hasattr(file, "getbuffer"):
+        # BytesIO: use its buffer from the current position without a copy and
+        # consume it like ``read()`` would
+        data = file.getbuffer()[file.tell() :]
+        file.seek(0, os.SEEK_END)
+    elif hasattr(file, "read"):
+        data = file.read()
+    else:
+        data = file
+    data = np.frombuffer(data, np.uint8)
+
+    result = load_ply_buffer(data, *args)
+    if result is None:
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "buffer.ply")
+            with open(path, "wb") as fid:
+                fid.write(data)
+            result = load_ply(path, *args)
+    return result
+
+
+def read(
+    filename,
+    read_normals=True,
+    read_uv=True,
+    read_color=True,
+    out=None,
+    index_dtype=np.int32,
+    vertex_dtype=np.float32,
+    read_faces=True,
+    num_threads=1,
+):
     """Read a PLY file and extract vertices, indices, normals, UV, and color information.
 
     Parameters
     ----------
-    filename : str
-        The path to the PLY file.
+    filename : str | os.PathLike | bytes | memoryview | io.BytesIO
+        The path to the PLY file, or its contents as a bytes-like object or a
+        binary file-like object. File-like objects are read from their current
+        position to the end and are left positioned at the end, like after
+        ``file.read()``. In memory files are decoded without being written to
+        disk.
     read_normals : bool, default: True
         If ``True``, the normals are read from the PLY file.
     read_uv : bool, default: True
@@ -63,39 +192,76 @@ def read(filename, read_normals=True, read_uv=True, read_color=True):
         available.
     read_color : bool, default: True
         If ``True``, the color information is read from the PLY file if available.
+    out : dict, optional
+        Preallocated arrays to read into, keyed by any of ``"vertices"``,
+        ``"indices"``, ``"normals"``, ``"uv"`` and ``"color"``. Each must be
+        a writable, C-contiguous array with the dtype and number of columns of
+        the corresponding output. When an array has at least as many rows as
+        needed, the data is written into it and the returned array is a view of
+        its leading rows; otherwise a new array is allocated. Useful to avoid
+        repeated allocations when reading many files of similar size.
+    index_dtype : numpy.dtype, default: numpy.int32
+        Data type of the returned ``indices``, either ``numpy.int32`` or
+        ``numpy.int64``. Reading the indices as ``pyvista.ID_TYPE`` lets them
+        be handed to VTK without a conversion.
+    vertex_dtype : numpy.dtype, default: numpy.float32
+        Data type of the returned ``vertices``, either ``numpy.float32`` or
+        ``numpy.float16``. Half precision halves the memory of the vertices,
+        for consumers that tolerate the reduced precision (e.g. GPU uploads).
+    read_faces : bool, default: True
+        If ``False``, the face element is not parsed at all, which skips its
+        cost when reading point clouds or when only the vertices are needed.
+    num_threads : int | None, default: 1
+        Number of threads used to extract the vertex data of large files.
+        ``None`` uses all available threads (``OMP_NUM_THREADS`` when set).
+        Has no effect when pyminiply was built without OpenMP.
+
+        .. warning::
+           A threaded read starts an OpenMP thread pool that does not survive
+           ``fork()``. A process forked afterwards, such as a
+           ``multiprocessing`` worker using the ``"fork"`` start method, hangs
+           if it reads with more than one thread itself. Use the ``"spawn"``
+           or ``"forkserver"`` start method to read with threads in child
+           processes.
 
     Returns
     -------
-    vertices : numpy.ndarray[float32]
+    vertices : numpy.ndarray[float32] | numpy.ndarray[float16]
         An array of vertex coordinates from the PLY file. Each row represents a
         vertex, and the columns represent the X, Y, and Z coordinates,
         respectively.
-    indices : numpy.ndarray[int32]
+    indices : numpy.ndarray[int32] | numpy.ndarray[int64]
         An array of triangle indices from the PLY file. Each row represents a
         triangle, and the columns represent the indices of the vertices that
-        make up the triangle.
-    normals : numpy.ndarray[float32]
+        make up the triangle. Empty when the file has no faces (e.g. a point
+        cloud) and ``None`` if `read_faces` is ``False``.
+    normals : numpy.ndarray[float32] | None
         An array of vertex normals from the PLY file, if `read_normals` is
         True.  Each row represents a normal, and the columns represent the X,
-        Y, and Z components of the normal. Returns an empty array if
-        `read_normals` is ``False``.
-    uv : numpy.ndarray[float32]
+        Y, and Z components of the normal. ``None`` if `read_normals` is
+        ``False`` or the file has no normals.
+    uv : numpy.ndarray[float32] | None
         An array of UV texture coordinates from the PLY file, if `read_uv` is
-        True.  Each row represents a UV coordinate. Returns an empty array if
-        `read_uv` is ``False``.
-    color : numpy.ndarray[uint8]
+        True.  Each row represents a UV coordinate. ``None`` if `read_uv` is
+        ``False`` or the file has no texture coordinates.
+    color : numpy.ndarray[uint8] | None
         An array of vertex colors from the PLY file, if `read_color` is
         True. Each row represents a color, and the columns represent the red,
-        green, and blue components of the color, respectively. Returns an empty
-        array if `read_color` is ``False``.
+        green, and blue components of the color, respectively. ``None`` if
+        `read_color` is ``False`` or the file has no color.
 
     Raises
     ------
     FileNotFoundError
-        If the specified STL file does not exist.
+        If the specified PLY file does not exist.
     RuntimeError
         If the STL file is not valid or cannot be read.
 
+    Notes
+    -----
+    The GIL is released while the file is parsed, so several files can be
+    read concurrently from a thread pool.
+
     Example
     -------
     >>> import pyminiply
@@ -142,12 +308,109 @@ def read(filename, read_normals=True, read_uv=True, read_color=True):
            [255, 255, 255]], dtype=uint8)
 
     """
-    if not os.path.isfile(filename):
-        raise FileNotFoundError(f'Invalid file or unable to locate "{filename}"')
-    return load_ply(filename, read_normals, read_uv, read_color)
+    if out is not None:
+        unknown = set(out) - set(_OUT_KEYS)
+        if unknown:
+            raise ValueError(
+                f"Invalid keys in `out`: {sorted(unknown)}. Expected any of {list(_OUT_KEYS)}"
+            )
+    index_dtype = np.dtype(index_dtype)
+    if index_dtype not in (np.int32, np.int64):
+        raise ValueError(f"`index_dtype` must be int32 or int64, not {index_dtype}")
+    vertex_dtype = np.dtype(vertex_dtype)
+    if vertex_dtype not in (np.float32, np.float16):
+        raise ValueError(f"`vertex_dtype` must be float32 or float16, not {vertex_dtype}")
+    if num_threads is not None and num_threads < 1:
+        raise ValueError(f"`num_threads` must be at least 1, not {num_threads}")
+    half = vertex_dtype == np.float16
+    if half and out is not None and getattr(out.get("vertices"), "dtype", None) == np.float16:
+        # half precision vertices are written as their raw bits
+        out = {**out, "vertices": out["vertices"].view(np.uint16)}
+
+    args = (
+        read_normals,
+        read_uv,
+        read_color,
+        out,
+        index_dtype == np.int64,
+        half,
+        read_faces,
+        0 if num_threads is None else num_threads,
+    )
+    if isinstance(filename, (bytes, bytearray, memoryview)) or hasattr(filename, "read"):
+        result = _read_buffer(filename, *args)
+    else:
+        result = load_ply(os.fspath(filename), *args)
+    if half:
+        result = (result[0].view(np.float16),) + result[1:]
+    return result
+
+
+def read_into_numba():
+    r"""Return a ctypes function reading a PLY file into preallocated buffers.
+
+    The returned function wraps the extension's C entry point
+    ``pyminiply_read_into`` and can be called from numba ``@njit`` (including
+    ``nogil=True``) code, avoiding a round trip through Python per file. Only
+    the vertices and triangle indices are read.
+
+    Its signature is ``read_into(filename, vertices, max_vertices, indices,
+    max_triangles, counts) -> int`` where:
+
+    * ``filename`` is a pointer to a null terminated, UTF-8 encoded path.
+    * ``vertices`` points to a C-contiguous ``float32`` buffer with room for
+      ``max_vertices`` rows of 3 values.
+    * ``indices`` points to a C-contiguous ``int32`` buffer with room for
+      ``max_triangles`` rows of 3 values.
+    * ``counts`` points to two ``int64`` values, set to the number of vertices
+      and triangles in the file.
+
+    The return value is ``0`` on success, ``1`` when a buffer is too small
+    (``counts`` still holds the required sizes) and ``-1`` when the file
+    cannot be opened or read.
+
+    Returns
+    -------
+    ctypes.CFUNCTYPE
+        The ``read_into`` function.
+
+    Example
+    -------
+    >>> import numba
+    >>> import numpy as np
+    >>> import pyminiply
+    >>> read_into = pyminiply.read_into_numba()
+    >>> @numba.njit(nogil=True)
+    ... def load(path, vertices, indices, counts):
+    ...     return read_into(
+    ...         path.ctypes, vertices.ctypes, vertices.shape[0],
+    ...         indices.ctypes, indices.shape[0], counts.ctypes,
+    ...     )
+    >>> path = np.frombuffer(b"example.ply\0", np.uint8)
+    >>> vertices = np.empty((100_000, 3), np.float32)
+    >>> indices = np.empty((200_000, 3), np.int32)
+    >>> counts = np.zeros(2, np.int64)
+    >>> load(path, vertices, indices, counts)
+    0
+    >>> counts
+    array([121, 200])
+
+    """
+    import ctypes
+
+    prototype = ctypes.CFUNCTYPE(
+        ctypes.c_int,
+        ctypes.c_void_p,
+        ctypes.c_void_p,
+        ctypes.c_int64,
+        ctypes.c_void_p,
+        ctypes.c_int64,
+        ctypes.c_void_p,
+    )
+    return prototype(read_into_address())
 
 
-def read_as_mesh(filename, read_normals=True, read_uv=True, read_color=True):
+def read_as_mesh(filename, read_normals=True, read_uv=True, read_color=True, read_faces=True):
     """
     Read a binary STL file and return it as a PyVista mesh.
 
@@ -165,6 +428,10 @@ def read_as_mesh(filename, read_normals=True, read_uv=True, read_color=True):
         available.
     read_color : bool, default: True
         If ``True``, the color information is read from the PLY file if available.
+    read_faces : bool, default: True
+        If ``False``, the faces are not read and the mesh is returned as a
+        point cloud. Files without faces are returned as point clouds either
+        way.
 
     Returns
     -------
@@ -197,12 +464,24 @@ def read_as_mesh(filename, read_normals=True, read_uv=True, read_color=True):
     Requires the ``pyvista`` library to be installed.
 
     """
-    vertices, indices, normals, uv, color = read(filename, read_normals, read_uv, read_color)
-    mesh = _polydata_from_faces(vertices, indices)
-    if read_normals and normals.size:
+    pv = _lazy_pyvista()
+    vertices, indices, normals, uv, color = read(
+        filename,
+        read_normals,
+        read_uv,
+        read_color,
+        index_dtype=pv["ID_TYPE"],
+        read_faces=read_faces,
+    )
+    if indices is None or not indices.size:
+        # point cloud: one vertex cell per point
+        mesh = pv["PolyData"](vertices)
+    else:
+        mesh = _polydata_from_triangles(vertices, indices)
+    if normals is not None:
         mesh.point_data["Normals"] = normals
-    if read_uv and uv.size:
+    if uv is not None:
         mesh.point_data["TCoords"] = uv
-    if read_color and color.size:
+    if color is not None:
         mesh.point_data["RGB"] = color
     return mesh
@@ -0,0 +1,315 @@
+#ifndef SIMD_HEADER_H
+#define SIMD_HEADER_H
+
+#include <cstddef>
+#include <cstdint>
+#include <cstring>
+
+// AVX2 kernels are compiled for x86-64 only and selected at runtime, so the
+// extension still runs on CPUs (and architectures) without AVX2.
+#if defined(__x86_64__) || defined(_M_X64)
+#define PYMINIPLY_X86 1
+#include <immintrin.h>
+#if defined(_MSC_VER) && !defined(__clang__)
+#include <intrin.h>
+#define PYMINIPLY_TARGET_AVX2
+#define PYMINIPLY_TARGET_F16C
+#else
+#define PYMINIPLY_TARGET_AVX2 __attribute__((target("avx2")))
+#define PYMINIPLY_TARGET_F16C __attribute__((target("avx2,f16c")))
+#endif
+#endif
+
+#ifdef PYMINIPLY_X86
+inline bool DetectAVX2() {
+#if defined(_MSC_VER) && !defined(__clang__)
+  int info[4];
+  __cpuid(info, 1);
+  const bool osxsave = (info[2] & (1 << 27)) != 0;
+  if (!osxsave || (_xgetbv(0) & 0x6) != 0x6) {
+    return false;
+  }
+  __cpuidex(info, 7, 0);
+  return (info[1] & (1 << 5)) != 0;
+#else
+  return __builtin_cpu_supports("avx2");
+#endif
+}
+
+inline bool HasAVX2() {
+  static const bool has_avx2 = DetectAVX2();
+  return has_avx2;
+}
+
+// Four rows per iteration: each 16 byte load starts at a row, so its 12
+// bytes are the low 12 bytes of each 128-bit lane. Requires at least one row
+// beyond the last row processed here, as both the loads and the final store
+// run a few bytes past the current row.
+PYMINIPLY_TARGET_AVX2 inline size_t PackRows12AVX2(const uint8_t *rows,
+                                                   size_t stride,
+                                                   size_t num_rows,
+                                                   uint8_t *dest) {
+  const __m256i pack = _mm256_setr_epi32(0, 1, 2, 4, 5, 6, 7, 3);
+  size_t row = 0;
+  for (; row + 5 <= num_rows; row += 4) {
+    const uint8_t *src = rows + row * stride;
+    __m256i ab = _mm256_inserti128_si256(
+        _mm256_castsi128_si256(
+            _mm_loadu_si128(reinterpret_cast<const __m128i *>(src))),
+        _mm_loadu_si128(reinterpret_cast<const __m128i *>(src + stride)), 1);
+    __m256i cd = _mm256_inserti128_si256(
+        _mm256_castsi128_si256(_mm_loadu_si128(
+            reinterpret_cast<const __m128i *>(src + 2 * stride))),
+        _mm_loadu_si128(reinterpret_cast<const __m128i *>(src + 3 * stride)),
+        1);
+    ab = _mm256_permutevar8x32_epi32(ab, pack);
+    cd = _mm256_permutevar8x32_epi32(cd, pack);
+    // the second store overwrites the two junk lanes of the first
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + row * 12), ab);
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + row * 12 + 24), cd);
+  }
+  return row;
+}
+
+// One row per iteration: the three indices and the junk lane after them are
+// widened to 64 bits, and the junk lane is overwritten by the next row, so
+// the last row is left for the caller.
+PYMINIPLY_TARGET_AVX2 inline size_t
+PackTrianglesAVX2(const uint8_t *rows, size_t num_rows, int64_t *dest) {
+  size_t row = 0;
+  for (; row + 1 < num_rows; row++) {
+    __m128i idx =
+        _mm_loadu_si128(reinterpret_cast<const __m128i *>(rows + row * 13 + 1));
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + row * 3),
+                        _mm256_cvtepi32_epi64(idx));
+  }
+  return row;
+}
+
+PYMINIPLY_TARGET_AVX2 inline size_t WidenInt32AVX2(const int32_t *src, size_t n,
+                                                   int64_t *dest) {
+  size_t i = 0;
+  for (; i + 4 <= n; i += 4) {
+    __m128i v = _mm_loadu_si128(reinterpret_cast<const __m128i *>(src + i));
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + i),
+                        _mm256_cvtepi32_epi64(v));
+  }
+  return i;
+}
+
+// Eight rows per iteration: gather 4 bytes from the start of each row's
+// color, drop the fourth byte of each within the 128-bit lanes and pack the
+// two 12 byte halves together. Requires three rows beyond the last row
+// processed here, to cover the extra byte read and the 8 bytes stored past
+// the packed colors.
+PYMINIPLY_TARGET_AVX2 inline size_t GatherRGBAVX2(const uint8_t *src,
+                                                  size_t stride,
+                                                  size_t num_rows,
+                                                  uint8_t *dest) {
+  const int s = (int)stride;
+  const __m256i offsets =
+      _mm256_setr_epi32(0, s, 2 * s, 3 * s, 4 * s, 5 * s, 6 * s, 7 * s);
+  const __m256i drop = _mm256_setr_epi8(
+      0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14, -1, -1, -1, -1, //
+      0, 1, 2, 4, 5, 6, 8, 9, 10, 12, 13, 14, -1, -1, -1, -1);
+  const __m256i pack = _mm256_setr_epi32(0, 1, 2, 4, 5, 6, 3, 7);
+  size_t row = 0;
+  for (; row + 11 <= num_rows; row += 8) {
+    __m256i rgb = _mm256_i32gather_epi32(
+        reinterpret_cast<const int *>(src + row * stride), offsets, 1);
+    rgb = _mm256_permutevar8x32_epi32(_mm256_shuffle_epi8(rgb, drop), pack);
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + row * 3), rgb);
+  }
+  return row;
+}
+
+// Reverse the bytes of each value within 32 byte blocks, using a shuffle
+// mask for the value size
+PYMINIPLY_TARGET_AVX2 inline size_t SwapBytesAVX2(const uint8_t *src,
+                                                  size_t num_bytes,
+                                                  uint8_t *dest,
+                                                  size_t value_bytes) {
+  __m256i mask;
+  switch (value_bytes) {
+  case 2:
+    mask =
+        _mm256_setr_epi8(1, 0, 3, 2, 5, 4, 7, 6, 9, 8, 11, 10, 13, 12, 15, 14,
+                         1, 0, 3, 2, 5, 4, 7, 6, 9, 8, 11, 10, 13, 12, 15, 14);
+    break;
+  case 4:
+    mask =
+        _mm256_setr_epi8(3, 2, 1, 0, 7, 6, 5, 4, 11, 10, 9, 8, 15, 14, 13, 12,
+                         3, 2, 1, 0, 7, 6, 5, 4, 11, 10, 9, 8, 15, 14, 13, 12);
+    break;
+  default:
+    mask =
+        _mm256_setr_epi8(7, 6, 5, 4, 3, 2, 1, 0, 15, 14, 13, 12, 11, 10, 9, 8,
+                         7, 6, 5, 4, 3, 2, 1, 0, 15, 14, 13, 12, 11, 10, 9, 8);
+  }
+  size_t i = 0;
+  for (; i + 32 <= num_bytes; i += 32) {
+    __m256i v = _mm256_loadu_si256(reinterpret_cast<const __m256i *>(src + i));
+    _mm256_storeu_si256(reinterpret_cast<__m256i *>(dest + i),
+                        _mm256_shuffle_epi8(v, mask));
+  }
+  return i;
+}
+
+// F16C shipped alongside AVX2 on every x86 CPU, so it uses the same check
+PYMINIPLY_TARGET_F16C inline size_t FloatToHalfF16C(const float *src, size_t n,
+                                                    uint16_t *dest) {
+  size_t i = 0;
+  for (; i + 8 <= n; i += 8) {
+    __m128i half =
+        _mm256_cvtps_ph(_mm256_loadu_ps(src + i), _MM_FROUND_TO_NEAREST_INT);
+    _mm_storeu_si128(reinterpret_cast<__m128i *>(dest + i), half);
+  }
+  return i;
+}
+#endif
+
+/**
+ * Copy the first 12 bytes (e.g. the XYZ of a vertex) of each of ``num_rows``
+ * rows ``stride`` bytes apart into ``dest``.
+ */
+inline void PackRows12(const uint8_t *rows, size_t stride, size_t num_rows,
+                       uint8_t *dest) {
+  size_t row = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2()) {
+    row = PackRows12AVX2(rows, stride, num_rows, dest);
+  }
+#endif
+  for (; row < num_rows; row++) {
+    std::memcpy(dest + row * 12, rows + row * stride, 12);
+  }
+}
+
+/**
+ * Strip the count byte from binary triangle rows laid out as
+ * ``{uchar 3, int32 a, int32 b, int32 c}`` (13 bytes per row) and write the
+ * packed indices to ``dest``.
+ */
+inline void PackTriangles(const uint8_t *rows, size_t num_rows, int32_t *dest) {
+  PackRows12(rows + 1, 13, num_rows, reinterpret_cast<uint8_t *>(dest));
+}
+
+// As above, widening the indices to int64 while packing
+inline void PackTriangles(const uint8_t *rows, size_t num_rows, int64_t *dest) {
+  size_t row = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2()) {
+    row = PackTrianglesAVX2(rows, num_rows, dest);
+  }
+#endif
+  for (; row < num_rows; row++) {
+    int32_t tri[3];
+    std::memcpy(tri, rows + row * 13 + 1, 12);
+    dest[row * 3] = tri[0];
+    dest[row * 3 + 1] = tri[1];
+    dest[row * 3 + 2] = tri[2];
+  }
+}
+
+// Sign extend ``n`` int32 values to int64
+inline void WidenInt32(const int32_t *src, size_t n, int64_t *dest) {
+  size_t i = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2()) {
+    i = WidenInt32AVX2(src, n, dest);
+  }
+#endif
+  for (; i < n; i++) {
+    dest[i] = src[i];
+  }
+}
+
+/**
+ * Copy three bytes per row (e.g. RGB colors) from rows ``stride`` bytes apart
+ * into ``dest``.
+ */
+inline void GatherRGB(const uint8_t *src, size_t stride, size_t num_rows,
+                      uint8_t *dest) {
+  size_t row = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2() && stride <= (1u << 27u)) {
+    row = GatherRGBAVX2(src, stride, num_rows, dest);
+  }
+#endif
+  for (; row < num_rows; row++) {
+    std::memcpy(dest + row * 3, src + row * stride, 3);
+  }
+}
+
+/**
+ * Reverse the byte order of ``n`` values of ``value_bytes`` bytes (1, 2, 4
+ * or 8) each, e.g. to read big endian data. ``src`` and ``dest`` may be the
+ * same buffer.
+ */
+inline void SwapBytes(const uint8_t *src, size_t n, size_t value_bytes,
+                      uint8_t *dest) {
+  if (value_bytes == 1) {
+    if (src != dest) {
+      std::memmove(dest, src, n);
+    }
+    return;
+  }
+  const size_t num_bytes = n * value_bytes;
+  size_t i = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2()) {
+    i = SwapBytesAVX2(src, num_bytes, dest, value_bytes);
+  }
+#endif
+  for (; i < num_bytes; i += value_bytes) {
+    uint8_t value[8];
+    std::memcpy(value, src + i, value_bytes);
+    for (size_t b = 0; b < value_bytes; b++) {
+      dest[i + b] = value[value_bytes - 1 - b];
+    }
+  }
+}
+
+// Round a float to the nearest IEEE half precision value (ties to even)
+inline uint16_t FloatToHalf(float value) {
+  uint32_t x;
+  std::memcpy(&x, &value, 4);
+  const uint32_t sign = (x >> 16) & 0x8000u;
+  x &= 0x7fffffffu;
+
+  uint32_t half;
+  if (x >= (127u + 16u) << 23u) {
+    // too large for a half (inf), or inf / nan (kept quiet)
+    half = x > 0x7f800000u ? 0x7e00u : 0x7c00u;
+  } else if (x < 113u << 23u) {
+    // subnormal half or zero: let the float adder do the rounding
+    const uint32_t magic_bits = 126u << 23u;
+    float magic, f;
+    std::memcpy(&magic, &magic_bits, 4);
+    std::memcpy(&f, &x, 4);
+    f += magic;
+    std::memcpy(&x, &f, 4);
+    half = x - magic_bits;
+  } else {
+    // rebias the exponent and round the mantissa to 10 bits
+    const uint32_t mant_odd = (x >> 13) & 1u;
+    x += ((15u - 127u) << 23u) + 0xfffu + mant_odd;
+    half = x >> 13;
+  }
+  return static_cast<uint16_t>(half | sign);
+}
+
+// Convert ``n`` floats to IEEE half precision
+inline void FloatToHalf(const float *src, size_t n, uint16_t *dest) {
+  size_t i = 0;
+#ifdef PYMINIPLY_X86
+  if (HasAVX2()) {
+    i = FloatToHalfF16C(src, n, dest);
+  }
+#endif
+  for (; i < n; i++) {
+    dest[i] = FloatToHalf(src[i]);
+  }
+}
+
+#endif // SIMD_HEADER_H
@@ -1,21 +1,189 @@
 #include "miniply/miniply.h"
+#include <algorithm>
 #include <cstdio>
+#include <vector>
 
 #include <nanobind/nanobind.h>
 #include <nanobind/ndarray.h>
 #include <nanobind/stl/string.h>
 
+#ifdef _OPENMP
+#include <omp.h>
+#endif
+
 #include "array_support.h"
+#include "mapped_file.h"
+#include "ply_ascii.h"
+#include "ply_buffer.h"
+#include "simd.h"
 
 namespace nb = nanobind;
 using namespace nb::literals;
 
+/**
+ * Raised when a file cannot be opened. Translated to the matching ``OSError``
+ * subclass (e.g. ``FileNotFoundError``) from the stored error code.
+ */
+class FileOpenError : public std::runtime_error {
+public:
+  FileOpenError(const std::string &filename, int code)
+      : std::runtime_error(filename), code_(code) {}
+  int code() const { return code_; }
+
+private:
+  int code_;
+};
+
+// Arrays returned by ``load_ply``
+struct PLYOutput {
+  // required
+  OutputArray<float, 3> vertices;
+  // half precision vertices (as raw bits), used when ``half_vertices`` is set
+  OutputArray<uint16_t, 3> vertices16;
+  bool half_vertices = false;
+  OutputArray<int, 3> indices;
+  // used instead of ``indices`` when ``wide_indices`` is set
+  OutputArray<int64_t, 3> indices64;
+  bool wide_indices = false;
+  // when false the face element is not parsed and the indices are None
+  bool read_faces = true;
+  // threads used to extract the vertex properties (with OpenMP)
+  int num_threads = 1;
+
+  // optionally loaded (returned as None when not loaded)
+  OutputArray<float, 3> normals;
+  OutputArray<float, 2> uv;
+  OutputArray<uint8_t, 3> color;
+
+  // Use the arrays in the ``out`` dictionary passed to ``read`` as buffers
+  void SetBuffers(const nb::dict &out) {
+    if (out.contains("vertices")) {
+      if (half_vertices) {
+        vertices16.SetBuffer(out["vertices"]);
+      } else {
+        vertices.SetBuffer(out["vertices"]);
+      }
+    }
+    if (out.contains("indices")) {
+      if (wide_indices) {
+        indices64.SetBuffer(out["indices"]);
+      } else {
+        indices.SetBuffer(out["indices"]);
+      }
+    }
+    if (out.contains("normals")) {
+      normals.SetBuffer(out["normals"]);
+    }
+    if (out.contains("uv")) {
+      uv.SetBuffer(out["uv"]);
+    }
+    if (out.contains("color")) {
+      color.SetBuffer(out["color"]);
+    }
+  }
+
+  void Reset() {
+    vertices.Reset();
+    vertices16.Reset();
+    indices.Reset();
+    indices64.Reset();
+    normals.Reset();
+    uv.Reset();
+    color.Reset();
+  }
+
+  // True once everything requested has been loaded
+  bool Done(bool gotVerts, bool gotFaces) const {
+    return gotVerts && (gotFaces || !read_faces);
+  }
+
+  // Point clouds have no face element: return no triangles rather than
+  // failing, unless the faces were not requested at all
+  void NoFaces() {
+    if (!read_faces) {
+      return;
+    }
+    if (wide_indices) {
+      indices64.Allocate(0);
+    } else {
+      indices.Allocate(0);
+    }
+  }
+
+  // Convert the loaded vertices to half precision when requested. The
+  // vertices are always extracted as float, since triangulating polygons
+  // needs them at full precision.
+  void Finish() {
+    if (half_vertices && vertices.loaded()) {
+      FloatToHalf(vertices.data(), vertices.rows() * 3,
+                  vertices16.Allocate(vertices.rows()));
+      vertices.Reset();
+    }
+  }
+
+  nb::tuple ToTuple() {
+    nb::object verts =
+        half_vertices ? vertices16.ToPython() : vertices.ToPython();
+    nb::object faces = wide_indices ? indices64.ToPython() : indices.ToPython();
+    return nb::make_tuple(verts, faces, normals.ToPython(), uv.ToPython(),
+                          color.ToPython());
+  }
+};
+
+// Files at least this large are memory mapped, smaller ones are read into
+// memory. Either way they are decoded directly rather than through miniply.
+static constexpr size_t kMapThreshold = 1u << 22u; // 4MB
+
+// Extract the triangle indices of the current (face) element as int32.
+// Polygons are triangulated row by row like in the direct decoder, since
+// miniply's ``extract_triangles`` advances by the triangle count
+// ``triangulate_polygon`` returns, which is 1 for any polygon with more than
+// four vertices.
+static void ExtractIndices(const miniply::PLYReader &reader, uint32_t prop_idx,
+                           bool polys, const float *pos, uint32_t num_verts,
+                           int *dest) {
+  if (!polys) {
+    reader.extract_list_property(prop_idx, miniply::PLYPropertyType::Int, dest);
+    return;
+  }
+  const uint32_t *counts = reader.get_list_counts(prop_idx);
+  const uint8_t *data = reader.get_list_data(prop_idx);
+  const miniply::PLYPropertyType type =
+      reader.element()->properties[prop_idx].type;
+  const uint32_t value_bytes = PropertySize(type);
+  std::vector<int> poly, tris;
+  for (uint32_t row = 0; row < reader.num_rows(); row++) {
+    const uint32_t count = counts[row];
+    if (count >= 3) {
+      poly.resize(count);
+      for (uint32_t i = 0; i < count; i++) {
+        poly[i] = ReadValue<int>(data + i * value_bytes, type);
+      }
+      dest = count == 3 ? std::copy(poly.begin(), poly.end(), dest)
+                        : TriangulatePolygon(poly, pos, num_verts, tris, dest);
+    }
+    data += (size_t)count * value_bytes;
+  }
+}
+
+// The list values miniply loaded for a property of the current element.
+// These are stored without the per row counts, so a triangle-only list of
+// int32 values is already laid out as the packed ``(n, 3)`` indices.
+static std::vector<uint8_t> &FaceListData(miniply::PLYReader &reader,
+                                          uint32_t prop_idx) {
+  uint32_t idx = 0;
+  while (reader.get_element(idx) != reader.element()) {
+    idx++;
+  }
+  return reader.get_element(idx)->properties[prop_idx].listData;
+}
+
 /**
  * This function reads a 3D mesh from a .ply file using the miniply library and
  * populates numpy arrays with vertex positions and triangle indices.
  */
-nb::tuple LoadPLY(const std::string &filename, bool read_normals = true,
-                  bool read_uv = true, bool read_color = true) {
+void LoadPLYFile(const std::string &filename, bool read_normals, bool read_uv,
+                 bool read_color, PLYOutput &out) {
 
   miniply::PLYReader reader(filename.c_str());
   if (!reader.valid()) {
@@ -27,68 +195,72 @@ nb::tuple LoadPLY(const std::string &filename, bool read_normals = true,
   uint32_t indexes[3];
   bool gotVerts = false, gotFaces = false;
 
-  // required
-  NDArray<float, 2> pos;
-  NDArray<int, 2> indices;
-
-  // optionally loaded (but always return empty)
-  NDArray<float, 2> normals = MakeNDArray<float, 2>({0, 3});
-  NDArray<float, 2> uv = MakeNDArray<float, 2>({0, 2});
-  NDArray<uint8_t, 2> color = MakeNDArray<uint8_t, 2>({0, 3});
-
-  while (reader.has_element() && (!gotVerts || !gotFaces)) {
+  while (reader.has_element() && !out.Done(gotVerts, gotFaces)) {
     if (reader.element_is(miniply::kPLYVertexElement) &&
         reader.load_element() && reader.find_pos(indexes)) {
       numVerts = reader.num_rows();
-      pos = MakeNDArray<float, 2>({(int)numVerts, 3});
-      pos_ptr = pos.data();
+      pos_ptr = out.vertices.Allocate(numVerts);
       reader.extract_properties(indexes, 3, miniply::PLYPropertyType::Float,
                                 pos_ptr);
 
       if (read_uv) {
         read_uv = reader.find_texcoord(indexes);
         if (read_uv) {
-          uv = MakeNDArray<float, 2>({(int)numVerts, 2});
           reader.extract_properties(indexes, 2, miniply::PLYPropertyType::Float,
-                                    uv.data());
+                                    out.uv.Allocate(numVerts));
         }
       }
       if (read_color) {
         read_color = reader.find_color(indexes);
         if (read_color) {
-          color = MakeNDArray<uint8_t, 2>({(int)numVerts, 3});
           reader.extract_properties(indexes, 3, miniply::PLYPropertyType::UChar,
-                                    color.data());
+                                    out.color.Allocate(numVerts));
         }
       }
       if (read_normals) {
         read_normals = reader.find_normal(indexes);
         if (read_normals) {
-          normals = MakeNDArray<float, 2>({(int)numVerts, 3});
           reader.extract_properties(indexes, 3, miniply::PLYPropertyType::Float,
-                                    normals.data());
+                                    out.normals.Allocate(numVerts));
         }
       }
       gotVerts = true;
-    } else if (reader.element_is(miniply::kPLYFaceElement) &&
+    } else if (out.read_faces && reader.element_is(miniply::kPLYFaceElement) &&
                reader.load_element() && reader.find_indices(indexes)) {
       bool polys = reader.requires_triangulation(indexes[0]);
       if (polys && !gotVerts) {
         throw std::runtime_error("Need vertex positions to triangulate faces.");
       }
       uint32_t numTriangles = reader.num_triangles(indexes[0]);
-      indices = MakeNDArray<int, 2>({(int)numTriangles, 3});
+      miniply::PLYPropertyType type =
+          reader.element()->properties[indexes[0]].type;
 
-      if (polys) {
-        reader.extract_triangles(indexes[0], pos_ptr, numVerts,
-                                 miniply::PLYPropertyType::Int, indices.data());
+      const bool int32 = type == miniply::PLYPropertyType::Int ||
+                         type == miniply::PLYPropertyType::UInt;
+      if (!out.wide_indices) {
+        // a triangle-only int32 list is handed over rather than copied
+        if (polys || !int32 ||
+            !out.indices.Adopt(std::move(FaceListData(reader, indexes[0])),
+                               numTriangles)) {
+          ExtractIndices(reader, indexes[0], polys, pos_ptr, numVerts,
+                         out.indices.Allocate(numTriangles));
+        }
+      } else if (!polys && int32) {
+        // widen straight from the loaded list data
+        WidenInt32(
+            reinterpret_cast<const int32_t *>(reader.get_list_data(indexes[0])),
+            3 * (size_t)numTriangles, out.indices64.Allocate(numTriangles));
       } else {
-        reader.extract_list_property(indexes[0], miniply::PLYPropertyType::Int,
-                                     indices.data());
+        // miniply only extracts to 32 bit types
+        std::vector<int> narrow(3 * (size_t)numTriangles);
+        ExtractIndices(reader, indexes[0], polys, pos_ptr, numVerts,
+                       narrow.data());
+        WidenInt32(narrow.data(), narrow.size(),
+                   out.indices64.Allocate(numTriangles));
       }
       gotFaces = true;
     }
-    if (gotVerts && gotFaces) {
+    if (out.Done(gotVerts, gotFaces)) {
       break;
     }
     reader.next_element();
@@ -99,10 +271,334 @@ nb::tuple LoadPLY(const std::string &filename, bool read_normals = true,
   }
 
   if (!gotFaces) {
-    throw std::runtime_error("Failed to load faces");
+    out.NoFaces();
+  }
+}
+
+/**
+ * Decode a PLY file held in memory.
+ *
+ * Follows the same element handling as ``LoadPLYFile``. ASCII elements that
+ * are needed are first converted to the binary layout, and then decoded the
+ * same way. Big endian vertices are byte swapped as they are extracted and
+ * big endian faces are converted to little endian rows first. Returns false
+ * when the file is laid out in a way this decoder does not handle (e.g. a
+ * variable size vertex element or a truncated body), in which case the
+ * caller should fall back to miniply.
+ */
+bool LoadPLYBuffer(const PLYBuffer &ply, bool read_normals, bool read_uv,
+                   bool read_color, PLYOutput &out) {
+  if (!ply.valid()) {
+    return false;
+  }
+  const bool ascii = ply.file_type() == PLYFileType::ASCII;
+  // the rest of the decoder assumes a little endian host, like miniply
+  const bool swap = ply.file_type() == PLYFileType::BinaryBigEndian;
+
+  float *pos_ptr = nullptr;
+  uint32_t numVerts = 0;
+  uint32_t indexes[3];
+  bool gotVerts = false, gotFaces = false;
+  // little endian binary rows of an ASCII or big endian element
+  std::vector<uint8_t> converted;
+
+  const uint8_t *data = ply.body();
+  const uint8_t *end = ply.end();
+  for (const PLYElement &elem : ply.elements()) {
+    const bool isVerts =
+        elem.name == miniply::kPLYVertexElement && FindPos(elem, indexes);
+    const bool isFaces = !isVerts && out.read_faces &&
+                         elem.name == miniply::kPLYFaceElement &&
+                         FindIndices(elem, indexes);
+
+    // element rows in the binary layout, and the start of the next element
+    const uint8_t *rows = data;
+    const uint8_t *rows_end = end;
+    const uint8_t *next = nullptr;
+    if (ascii) {
+      next = isVerts || isFaces ? AsciiToBinary(elem, data, end, converted)
+                                : SkipAsciiElement(elem, data, end);
+      if (next == nullptr) {
+        return false;
+      }
+      rows = converted.data();
+      rows_end = rows + converted.size();
+    }
+
+    if (isVerts) {
+      if (!elem.fixedSize) {
+        return false;
+      }
+      if (!ascii) {
+        next = SkipElement(elem, data, end);
+        if (next == nullptr) {
+          return false;
+        }
+      }
+
+      numVerts = elem.count;
+      pos_ptr = out.vertices.Allocate(numVerts);
+      ColumnExtractor columns(elem);
+      columns.Add(indexes, 3, pos_ptr);
+
+      if (read_uv && FindTexcoord(elem, indexes)) {
+        columns.Add(indexes, 2, out.uv.Allocate(numVerts));
+      }
+      if (read_color && FindColor(elem, indexes)) {
+        columns.Add(indexes, 3, out.color.Allocate(numVerts));
+      }
+      if (read_normals && FindNormal(elem, indexes)) {
+        columns.Add(indexes, 3, out.normals.Allocate(numVerts));
+      }
+      // big endian values are swapped in place once extracted, unless they
+      // need converting, in which case the rows are swapped beforehand
+      bool swap_values = swap;
+      if (swap && !columns.native()) {
+        if (SwapElement(elem, data, end, converted) == nullptr) {
+          return false;
+        }
+        rows = converted.data();
+        swap_values = false;
+      }
+      columns.Extract(rows, out.num_threads, swap_values);
+      gotVerts = true;
+    } else if (isFaces) {
+      if (elem.properties[indexes[0]].countType == PLYPropertyType::None) {
+        return false;
+      }
+      // Packed big endian triangles are extracted as they are and their
+      // indices swapped afterwards. Other big endian face lists are first
+      // converted to little endian rows.
+      FaceList faces;
+      const bool swap_indices =
+          swap && ScanPackedTriangles(elem, indexes[0], data, end, faces);
+      if (swap && !swap_indices) {
+        next = SwapElement(elem, data, end, converted);
+        if (next == nullptr) {
+          return false;
+        }
+        rows = converted.data();
+        rows_end = rows + converted.size();
+      }
+      if (!faces.packed &&
+          !ScanFaceList(elem, indexes[0], rows, rows_end, faces)) {
+        return false;
+      }
+      if (!faces.triangles_only && !gotVerts) {
+        throw std::runtime_error("Need vertex positions to triangulate faces.");
+      }
+      if (swap_indices) {
+        // swapped as int32, before any widening
+        std::vector<int> narrow;
+        int *dest;
+        if (out.wide_indices) {
+          narrow.resize(3 * (size_t)faces.num_triangles);
+          dest = narrow.data();
+        } else {
+          dest = out.indices.Allocate(faces.num_triangles);
+        }
+        PackTriangles(rows, faces.num_triangles, dest);
+        SwapBytes(reinterpret_cast<uint8_t *>(dest),
+                  3 * (size_t)faces.num_triangles, 4,
+                  reinterpret_cast<uint8_t *>(dest));
+        if (out.wide_indices) {
+          WidenInt32(narrow.data(), narrow.size(),
+                     out.indices64.Allocate(faces.num_triangles));
+        }
+      } else if (out.wide_indices) {
+        ExtractFaceList(elem, indexes[0], rows, rows_end, pos_ptr, numVerts,
+                        faces, out.indices64.Allocate(faces.num_triangles));
+      } else {
+        ExtractFaceList(elem, indexes[0], rows, rows_end, pos_ptr, numVerts,
+                        faces, out.indices.Allocate(faces.num_triangles));
+      }
+      if (!ascii && (!swap || swap_indices)) {
+        next = faces.end;
+      }
+      gotFaces = true;
+    } else if (!ascii) {
+      next = SkipElement(elem, data, end, swap);
+      if (next == nullptr) {
+        return false;
+      }
+    }
+    if (out.Done(gotVerts, gotFaces)) {
+      break;
+    }
+    data = next;
+  }
+
+  if (!gotVerts) {
+    throw std::runtime_error("Failed to load vertices");
+  }
+
+  if (!gotFaces) {
+    out.NoFaces();
   }
 
-  return nb::make_tuple(pos, indices, normals, uv, color);
+  return true;
 }
 
-NB_MODULE(_wrapper, m) { m.def("load_ply", &LoadPLY); }
+/**
+ * Read a PLY file, decoding it directly from memory and falling back to
+ * miniply for layouts the decoder does not handle. Does not need the GIL.
+ */
+void ReadPLY(const std::string &filename, bool read_normals, bool read_uv,
+             bool read_color, PLYOutput &out) {
+  MappedFile file(filename.c_str(), kMapThreshold);
+  if (file.error() != 0) {
+    throw FileOpenError(filename, file.error());
+  }
+  bool loaded =
+      file.valid() && LoadPLYBuffer(PLYBuffer(file.data(), file.size()),
+                                    read_normals, read_uv, read_color, out);
+  if (!loaded) {
+    out.Reset();
+    LoadPLYFile(filename, read_normals, read_uv, read_color, out);
+  }
+  out.Finish();
+}
+
+// Number of threads to use for ``num_threads``, where 0 means all available
+// threads (``OMP_NUM_THREADS`` when set). Always 1 without OpenMP. Threads
+// are opt-in as libgomp's thread pool hangs in processes forked after using
+// it.
+static int ResolveThreads(int num_threads) {
+#ifdef _OPENMP
+  return num_threads > 0 ? num_threads : omp_get_max_threads();
+#else
+  (void)num_threads;
+  return 1;
+#endif
+}
+
+nb::tuple LoadPLY(const std::string &filename, bool read_normals = true,
+                  bool read_uv = true, bool read_color = true,
+                  nb::object out_arrays = nb::none(),
+                  bool int64_indices = false, bool half_vertices = false,
+                  bool read_faces = true, int num_threads = 1) {
+  PLYOutput out;
+  out.wide_indices = int64_indices;
+  out.half_vertices = half_vertices;
+  out.read_faces = read_faces;
+  out.num_threads = ResolveThreads(num_threads);
+  if (!out_arrays.is_none()) {
+    out.SetBuffers(nb::cast<nb::dict>(out_arrays));
+  }
+
+  // Parsing only touches raw buffers, so the GIL is held just to set up the
+  // outputs and to wrap them as numpy arrays afterwards.
+  {
+    nb::gil_scoped_release release;
+    ReadPLY(filename, read_normals, read_uv, read_color, out);
+  }
+  return out.ToTuple();
+}
+
+/**
+ * Read a PLY file held in memory (e.g. ``bytes`` or a ``BytesIO`` buffer).
+ *
+ * Returns None when the file is valid but cannot be decoded directly (e.g.
+ * a variable size vertex element), in which case the caller should read it
+ * from disk instead.
+ */
+nb::object
+LoadPLYFromBuffer(nb::ndarray<const uint8_t, nb::ndim<1>, nb::c_contig> data,
+                  bool read_normals = true, bool read_uv = true,
+                  bool read_color = true, nb::object out_arrays = nb::none(),
+                  bool int64_indices = false, bool half_vertices = false,
+                  bool read_faces = true, int num_threads = 1) {
+  PLYOutput out;
+  out.wide_indices = int64_indices;
+  out.half_vertices = half_vertices;
+  out.read_faces = read_faces;
+  out.num_threads = ResolveThreads(num_threads);
+  if (!out_arrays.is_none()) {
+    out.SetBuffers(nb::cast<nb::dict>(out_arrays));
+  }
+
+  bool loaded;
+  {
+    nb::gil_scoped_release release;
+    PLYBuffer ply(reinterpret_cast<const char *>(data.data()), data.shape(0));
+    if (!ply.valid()) {
+      throw std::runtime_error("Invalid or unrecognized PLY file format.");
+    }
+    loaded = LoadPLYBuffer(ply, read_normals, read_uv, read_color, out);
+    out.Finish();
+  }
+  return loaded ? nb::object(out.ToTuple()) : nb::none();
+}
+
+/**
+ * C entry point reading the vertices and triangle indices of a PLY file into
+ * caller provided buffers, for callers that cannot go through Python (e.g.
+ * numba ``@njit(nogil=True)`` code). See ``pyminiply.read_into_numba``.
+ *
+ * ``vertices`` and ``indices`` have room for ``max_vertices`` and
+ * ``max_triangles`` rows. On return ``counts`` holds the number of vertices
+ * and triangles in the file, also when the buffers are too small.
+ *
+ * Returns 0 on success, 1 when a buffer is too small and -1 when the file
+ * cannot be opened or read.
+ */
+extern "C" int pyminiply_read_into(const char *filename, float *vertices,
+                                   int64_t max_vertices, int32_t *indices,
+                                   int64_t max_triangles, int64_t *counts) {
+  counts[0] = counts[1] = 0;
+  PLYOutput out;
+  out.vertices.SetBuffer(vertices, (size_t)std::max<int64_t>(max_vertices, 0));
+  out.indices.SetBuffer(indices, (size_t)std::max<int64_t>(max_triangles, 0));
+  try {
+    ReadPLY(filename, false, false, false, out);
+  } catch (const std::exception &) {
+    return -1;
+  }
+  counts[0] = (int64_t)out.vertices.rows();
+  counts[1] = (int64_t)out.indices.rows();
+  return out.vertices.in_buffer() && out.indices.in_buffer() ? 0 : 1;
+}
+
+/**
+ * Fill ``offsets`` with ``i * stride``: the VTK cell offsets of a mesh whose
+ * cells all have ``stride`` points.
+ */
+template <typename T>
+void FillOffsets(nb::ndarray<T, nb::ndim<1>, nb::c_contig> offsets,
+                 int64_t stride) {
+  T *data = offsets.data();
+  const size_t n = offsets.shape(0);
+  nb::gil_scoped_release release;
+  for (size_t i = 0; i < n; i++) {
+    data[i] = static_cast<T>(i * stride);
+  }
+}
+
+NB_MODULE(_wrapper, m) {
+  nb::register_exception_translator([](const std::exception_ptr &p,
+                                       void * /* unused */) {
+    try {
+      std::rethrow_exception(p);
+    } catch (const FileOpenError &e) {
+#ifdef _WIN32
+      PyErr_SetExcFromWindowsErrWithFilename(PyExc_OSError, e.code(), e.what());
+#else
+      errno = e.code();
+      PyErr_SetFromErrnoWithFilename(PyExc_OSError, e.what());
+#endif
+    }
+  });
+
+  m.def("load_ply", &LoadPLY, "filename"_a, "read_normals"_a = true,
+        "read_uv"_a = true, "read_color"_a = true, "out"_a.none() = nb::none(),
+        "int64_indices"_a = false, "half_vertices"_a = false,
+        "read_faces"_a = true, "num_threads"_a = 1);
+  m.def("load_ply_buffer", &LoadPLYFromBuffer, "data"_a,
+        "read_normals"_a = true, "read_uv"_a = true, "read_color"_a = true,
+        "out"_a.none() = nb::none(), "int64_indices"_a = false,
+        "half_vertices"_a = false, "read_faces"_a = true, "num_threads"_a = 1);
+  m.def("fill_offsets", &FillOffsets<int64_t>, "offsets"_a, "stride"_a);
+  m.def("fill_offsets", &FillOffsets<int32_t>, "offsets"_a, "stride"_a);
+  m.def("read_into_address",
+        []() { return reinterpret_cast<uintptr_t>(&pyminiply_read_into); });
+}
@@ -1,5 +1,10 @@
 """Test pyminiply."""
 
+import gc
+import io
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+
 import numpy as np
 import pyminiply
 import pytest
@@ -24,6 +29,16 @@ def plyfile_ascii(tmpdir):
     return str(filename)
 
 
+@pytest.fixture
+def plyfile_large(tmpdir):
+    # large enough to be memory mapped and decoded without miniply
+    filename = tmpdir.join("large.ply")
+    mesh = pv.Plane(i_resolution=400, j_resolution=400).triangulate()
+    mesh["RGB"] = np.vstack([np.linspace(0, 255, mesh.n_points, dtype=np.uint8)] * 3).T
+    mesh.save(filename, texture="RGB")
+    return str(filename)
+
+
 def test_read_binary(plyfile):
     pv_mesh = pv.read(plyfile)
 
@@ -46,6 +61,156 @@ def test_read_ascii(plyfile_ascii):
     assert np.allclose(pv_mesh["RGB"], color)
 
 
+def test_read_binary_large(plyfile_large):
+    pv_mesh = pv.read(plyfile_large)
+
+    points, ind, normals, uv, color = pyminiply.read(plyfile_large)
+    assert np.allclose(pv_mesh.points, points)
+    assert np.allclose(pv_mesh._connectivity_array, ind.ravel())
+    assert np.allclose(pv_mesh["Normals"], normals)
+    assert np.allclose(pv_mesh["TCoords"], uv)
+    assert np.allclose(pv_mesh["RGB"], color)
+
+
+def test_read_missing(tmpdir):
+    with pytest.raises(FileNotFoundError):
+        pyminiply.read(str(tmpdir.join("missing.ply")))
+
+    with pytest.raises(OSError):
+        pyminiply.read(str(tmpdir))
+
+
+def test_read_optional_none(plyfile):
+    _, _, normals, uv, color = pyminiply.read(
+        plyfile, read_normals=False, read_uv=False, read_color=False
+    )
+    assert normals is None
+    assert uv is None
+    assert color is None
+
+
+@pytest.mark.parametrize("fixture", ["plyfile", "plyfile_large"])
+def test_read_out(fixture, request):
+    filename = request.getfixturevalue(fixture)
+    points, ind, normals, uv, color = pyminiply.read(filename)
+
+    out = {
+        "vertices": np.empty((points.shape[0] + 10, 3), np.float32),
+        "indices": np.empty((ind.shape[0] + 10, 3), np.int32),
+        "uv": np.empty((1, 2), np.float32),  # too small, must be allocated
+    }
+    out_points, out_ind, out_normals, out_uv, _ = pyminiply.read(filename, out=out)
+    assert np.shares_memory(out_points, out["vertices"])
+    assert np.shares_memory(out_ind, out["indices"])
+    assert not np.shares_memory(out_uv, out["uv"])
+    assert np.array_equal(points, out_points)
+    assert np.array_equal(ind, out_ind)
+    assert np.array_equal(normals, out_normals)
+    assert np.array_equal(uv, out_uv)
+
+    with pytest.raises(ValueError, match="Invalid keys"):
+        pyminiply.read(filename, out={"points": out["vertices"]})
+
+    with pytest.raises(TypeError):
+        pyminiply.read(filename, out={"vertices": out["indices"]})
+
+
+@pytest.mark.parametrize("fixture", ["plyfile", "plyfile_large"])
+def test_read_index_dtype(fixture, request):
+    filename = request.getfixturevalue(fixture)
+    _, ind, _, _, _ = pyminiply.read(filename)
+    _, ind64, _, _, _ = pyminiply.read(filename, index_dtype=np.int64)
+    assert ind64.dtype == np.int64
+    assert np.array_equal(ind, ind64)
+
+    with pytest.raises(ValueError, match="index_dtype"):
+        pyminiply.read(filename, index_dtype=np.float32)
+
+
+def test_read_into_numba(plyfile_large):
+    points, ind, _, _, _ = pyminiply.read(plyfile_large)
+    read_into = pyminiply.read_into_numba()
+
+    path = np.frombuffer(str(plyfile_large).encode() + b"\0", np.uint8)
+    vertices = np.empty((points.shape[0], 3), np.float32)
+    indices = np.empty((ind.shape[0], 3), np.int32)
+    counts = np.zeros(2, np.int64)
+    args = (vertices.ctypes.data, vertices.shape[0], indices.ctypes.data, indices.shape[0])
+    assert read_into(path.ctypes.data, *args, counts.ctypes.data) == 0
+    assert counts.tolist() == [points.shape[0], ind.shape[0]]
+    assert np.array_equal(vertices, points)
+    assert np.array_equal(indices, ind)
+
+    # too small
+    counts[:] = 0
+    assert read_into(path.ctypes.data, vertices.ctypes.data, 1, *args[2:], counts.ctypes.data) == 1
+    assert counts.tolist() == [points.shape[0], ind.shape[0]]
+
+    missing = np.frombuffer(b"missing.ply\0", np.uint8)
+    assert read_into(missing.ctypes.data, *args, counts.ctypes.data) == -1
+
+
+@pytest.mark.parametrize("fixture", ["plyfile", "plyfile_large"])
+def test_read_vertex_dtype(fixture, request):
+    filename = request.getfixturevalue(fixture)
+    points, _, _, _, _ = pyminiply.read(filename)
+    points16, _, _, _, _ = pyminiply.read(filename, vertex_dtype=np.float16)
+    assert points16.dtype == np.float16
+    assert np.array_equal(points16, points.astype(np.float16))
+
+    out = {"vertices": np.empty((points.shape[0], 3), np.float16)}
+    points16, _, _, _, _ = pyminiply.read(filename, vertex_dtype=np.float16, out=out)
+    assert np.shares_memory(points16, out["vertices"])
+    assert np.array_equal(points16, points.astype(np.float16))
+
+    with pytest.raises(ValueError, match="vertex_dtype"):
+        pyminiply.read(filename, vertex_dtype=np.float64)
+
+
+@pytest.mark.parametrize("fixture", ["plyfile", "plyfile_ascii", "plyfile_large"])
+def test_read_buffer(fixture, request):
+    filename = request.getfixturevalue(fixture)
+    expected = pyminiply.read(filename)
+    with open(filename, "rb") as fid:
+        data = fid.read()
+
+    for file in [data, memoryview(data), io.BytesIO(data)]:
+        for arr, ref_arr in zip(pyminiply.read(file), expected):
+            assert np.array_equal(arr, ref_arr)
+
+    with pytest.raises(RuntimeError, match="Invalid"):
+        pyminiply.read(b"not a ply file")
+
+
+def test_read_buffer_consumes_file(plyfile, tmp_path):
+    expected = pyminiply.read(plyfile)
+    with open(plyfile, "rb") as fid:
+        data = fid.read()
+
+    # every file-like object is read from its position to the end
+    prefix = b"prefix"
+    filename = tmp_path / "prefixed.ply"
+    filename.write_bytes(prefix + data)
+    with open(filename, "rb") as reader:
+        for file in [io.BytesIO(prefix + data), reader]:
+            file.seek(len(prefix))
+            for arr, ref_arr in zip(pyminiply.read(file), expected):
+                assert np.array_equal(arr, ref_arr)
+            assert file.tell() == len(prefix) + len(data)
+            assert file.read() == b""
+
+
+def test_read_threaded(plyfile, plyfile_large):
+    filenames = [plyfile, plyfile_large] * 4
+    expected = [pyminiply.read(filename) for filename in filenames]
+    with ThreadPoolExecutor(4) as pool:
+        results = list(pool.map(pyminiply.read, filenames))
+
+    for result, ref in zip(results, expected):
+        for arr, ref_arr in zip(result, ref):
+            assert np.array_equal(arr, ref_arr)
+
+
 def test_read_as_mesh(plyfile):
     pv_mesh = pv.read(plyfile)
 
@@ -58,3 +223,254 @@ def test_read_as_mesh(plyfile):
 
     ply_mesh = pyminiply.read_as_mesh(plyfile, read_normals=False)
     assert ["Normals"] not in ply_mesh.point_data
+
+
+def test_read_faces(plyfile, tmpdir):
+    points, ind, *_ = pyminiply.read(plyfile, read_faces=False)
+    assert ind is None
+    assert np.allclose(points, pv.read(plyfile).points)
+
+    mesh = pyminiply.read_as_mesh(plyfile, read_faces=False)
+    assert mesh.n_points == mesh.n_cells == points.shape[0]
+
+    # a point cloud has no face element
+    filename = str(tmpdir.join("cloud.ply"))
+    cloud = pv.PolyData(np.random.default_rng(0).random((100, 3)))
+    cloud.save(filename)
+    points, ind, *_ = pyminiply.read(filename)
+    assert np.allclose(points, cloud.points)
+    assert ind.shape == (0, 3)
+    mesh = pyminiply.read_as_mesh(filename)
+    assert np.allclose(mesh.points, cloud.points)
+    assert mesh.n_cells == cloud.n_points
+
+    # or no face element at all
+    data = b"ply\nformat ascii 1.0\nelement vertex 2\nproperty float x\nproperty float y\n"
+    data += b"property float z\nend_header\n0 0 0\n1 2 3\n"
+    with open(filename, "wb") as fid:
+        fid.write(data)
+    for source in (filename, data):
+        points, ind, *_ = pyminiply.read(source)
+        assert np.array_equal(points, [[0, 0, 0], [1, 2, 3]])
+        assert ind.shape == (0, 3)
+
+
+def test_read_num_threads(plyfile_large):
+    expected = pyminiply.read(plyfile_large, num_threads=1)
+    for num_threads in (None, 4):
+        result = pyminiply.read(plyfile_large, num_threads=num_threads)
+        for arr, arr_expected in zip(result, expected):
+            assert np.array_equal(arr, arr_expected)
+
+    with pytest.raises(ValueError, match="num_threads"):
+        pyminiply.read(plyfile_large, num_threads=0)
+
+
+@pytest.mark.skipif("fork" not in multiprocessing.get_all_start_methods(), reason="requires fork")
+def test_read_fork_after_threads(plyfile_large):
+    # a process forked after a threaded read must still be able to read with
+    # the default number of threads
+    expected = pyminiply.read(plyfile_large, num_threads=4)
+    with multiprocessing.get_context("fork").Pool(1) as pool:
+        result = pool.apply_async(pyminiply.read, (plyfile_large,)).get(timeout=60)
+    for arr, arr_expected in zip(result, expected):
+        assert np.array_equal(arr, arr_expected)
+
+
+def test_polydata_from_triangles():
+    from pyminiply.reader import _polydata_from_faces, _polydata_from_triangles
+
+    points = np.random.default_rng(0).random((100, 3))
+    triangles = np.random.default_rng(1).integers(0, 100, (50, 3)).astype(pv.ID_TYPE)
+    expected = _polydata_from_faces(points, triangles)
+
+    # the triangles are shared with VTK and must outlive the original array
+    mesh = _polydata_from_triangles(points, triangles.copy())
+    polys = mesh.GetPolys()
+    del mesh
+    gc.collect()
+    assert np.array_equal(
+        pv.convert_array(polys.GetConnectivityArray()), expected._connectivity_array
+    )
+    assert np.array_equal(pv.convert_array(polys.GetOffsetsArray()), expected._offset_array)
+
+
+# doubles are converted, and a face flag makes the face rows variable size
+@pytest.mark.parametrize("position_type, face_flag", [("float", False), ("double", True)])
+def test_read_big_endian(tmpdir, position_type, face_flag):
+    rng = np.random.default_rng(0)
+    n_points, n_faces = 1000, 500
+    points = rng.random((n_points, 3))
+    color = rng.integers(0, 256, (n_points, 3), dtype=np.uint8)
+    faces = rng.integers(0, n_points, (n_faces, 3))
+
+    def make_ply(order):
+        pos_dtype = order + {"float": "f4", "double": "f8"}[position_type]
+        vertex_dtype = [(c, pos_dtype) for c in "xyz"]
+        vertex_dtype += [(c, "u1") for c in ("red", "green", "blue")]
+        vertices = np.empty(n_points, vertex_dtype)
+        for i, c in enumerate("xyz"):
+            vertices[c] = points[:, i]
+        for i, c in enumerate(("red", "green", "blue")):
+            vertices[c] = color[:, i]
+        face_dtype = [("n", "u1"), ("idx", order + "i4", 3)]
+        if face_flag:
+            face_dtype.append(("flag", order + "i2"))
+        face_rows = np.empty(n_faces, face_dtype)
+        face_rows["n"] = 3
+        face_rows["idx"] = faces
+        if face_flag:
+            face_rows["flag"] = 7
+        # an element with a multi-byte list count that must be skipped
+        extra = np.empty(2, [("n", order + "u2"), ("values", order + "f4", 2)])
+        extra["n"] = 2
+        extra["values"] = 1.5
+        fmt = "binary_little_endian" if order == "<" else "binary_big_endian"
+        header = (
+            f"ply\nformat {fmt} 1.0\nelement vertex {n_points}\n"
+            + "".join(f"property {position_type} {c}\n" for c in "xyz")
+            + "property uchar red\nproperty uchar green\nproperty uchar blue\n"
+            + "element extra 2\nproperty list ushort float values\n"
+            + f"element face {n_faces}\nproperty list uchar int vertex_indices\n"
+            + ("property short flag\n" if face_flag else "")
+            + "end_header\n"
+        )
+        return header.encode() + vertices.tobytes() + extra.tobytes() + face_rows.tobytes()
+
+    expected = pyminiply.read(make_ply("<"))
+    big = make_ply(">")
+    for index_dtype in (np.int32, np.int64):
+        indices = pyminiply.read(big, index_dtype=index_dtype)[1]
+        assert np.array_equal(indices, faces)
+    filename = str(tmpdir.join("big.ply"))
+    with open(filename, "wb") as fid:
+        fid.write(big)
+    for source in (big, filename):
+        result = pyminiply.read(source)
+        for arr, arr_expected in zip(result, expected):
+            if arr_expected is None:
+                assert arr is None
+            else:
+                assert np.array_equal(arr, arr_expected)
+    assert np.array_equal(expected[1], faces)
+    assert np.array_equal(expected[4], color)
+
+
+def _ascii_ply(vertex_type, vertex_rows, face_rows, index_type="int"):
+    """Return an ASCII PLY file with an extra element between vertices and faces."""
+    header = (
+        f"ply\nformat ascii 1.0\nelement vertex {len(vertex_rows)}\n"
+        + "".join(f"property {vertex_type} {c}\n" for c in "xyz")
+        + "element material 2\nproperty float shininess\nproperty list uchar float weights\n"
+        + f"element face {len(face_rows)}\nproperty list uchar {index_type} vertex_indices\n"
+        + "end_header\n"
+    )
+    rows = vertex_rows + ["0.5 2 1 2", "1.5 0"] + face_rows
+    return (header + "\n".join(rows) + "\n").encode()
+
+
+@pytest.mark.parametrize("vertex_type", ["float", "double"])
+def test_read_ascii_values(vertex_type):
+    from pyminiply._wrapper import load_ply_buffer
+
+    tokens = [
+        "1.5e3", "2E-5", "-3.25e-7", "-0", "+4.5", "1e+2", ".5", "5.", "-0.0",
+        "0.12345678901234567890123", "123456789012345678901234", "9007199254740993.000000001",
+        "1e-40", "3.4028235e38", "1.5e30", "7e-30", "1e400", "-1e-400",
+    ]  # fmt: skip
+    # plenty of ordinary values for the fast paths
+    values = np.random.default_rng(0).standard_normal(3000) * 10.0 ** np.arange(-10, 20)[:, None]
+    tokens += [repr(value) for value in values.ravel().tolist()]
+    vertex_rows = [" ".join(tokens[i : i + 3]) for i in range(0, len(tokens), 3)]
+    data = _ascii_ply(vertex_type, vertex_rows, ["3 0 1 2"])
+
+    # decoded directly rather than through miniply
+    assert load_ply_buffer(np.frombuffer(data, np.uint8)) is not None
+    points = pyminiply.read(data)[0]
+    expected = np.array([float(token) for token in tokens]).astype(np.float32)
+    assert np.array_equal(points.ravel(), expected)
+    assert np.array_equal(np.signbit(points.ravel()), np.signbit(expected))
+
+
+def test_read_ascii_ints_and_faces():
+    from pyminiply._wrapper import load_ply_buffer
+
+    vertex_rows = ["+0 -0 0", "2 0 0", "3 2 0", "1 3 0", "-1 2 0", "-12 1 2147483647"]
+    # a pentagon with an index out of range cannot be triangulated
+    face_rows = ["4 0 1 2 3", "3 1 5 +2", "5 0 1 2 3 4", "3 4 3 5", "5 0 1 2 3 99", "3 0 1 2"]
+    data = _ascii_ply("int", vertex_rows, face_rows, index_type="uint")
+    assert load_ply_buffer(np.frombuffer(data, np.uint8)) is not None
+    points, indices = pyminiply.read(data)[:2]
+
+    # the same mesh stored in binary
+    vertices = np.array([row.split() for row in vertex_rows], np.int64).astype("<i4")
+    binary = (
+        "ply\nformat binary_little_endian 1.0\nelement vertex 6\n"
+        + "".join(f"property int {c}\n" for c in "xyz")
+        + f"element face {len(face_rows)}\n"
+        + "property list uchar uint vertex_indices\nend_header\n"
+    ).encode() + vertices.tobytes()
+    for row in face_rows:
+        face = np.array(row.split(), np.int64)
+        binary += np.uint8(face[0]).tobytes() + face[1:].astype("<u4").tobytes()
+    expected_points, expected_indices = pyminiply.read(binary)[:2]
+    assert np.array_equal(points, vertices.astype(np.float32))
+    assert np.array_equal(points, expected_points)
+    assert np.array_equal(indices, expected_indices)
+    assert indices.shape == (2 + 1 + 3 + 1 + 3 + 1, 3)
+
+    # the pentagon is split into three triangles covering its area
+    def area(tri):
+        return np.linalg.norm(np.cross(tri[1] - tri[0], tri[2] - tri[0])) / 2
+
+    pentagon = [area(points[tri]) for tri in indices[3:6]]
+    assert np.isclose(sum(pentagon), 8.0)
+    assert min(pentagon) > 0
+
+    # its rows are defined (degenerate) and the following faces stay in place
+    for index_dtype in (np.int32, np.int64):
+        indices = pyminiply.read(data, index_dtype=index_dtype)[1]
+        assert np.array_equal(indices[7:], [[0, 0, 0]] * 3 + [[0, 1, 2]])
+
+
+def test_read_polygons_fallback(tmpdir):
+    from pyminiply._wrapper import load_ply_buffer
+
+    vertex_rows = ["0 0 0", "2 0 0", "3 2 0", "1 3 0", "-1 2 0"]
+    face_rows = ["5 0 1 2 3 4", "5 4 3 2 1 0", "5 0 1 2 3 99", "3 0 1 2"]
+    expected = pyminiply.read(_ascii_ply("float", vertex_rows, face_rows))[1]
+    assert expected.shape == (3 + 3 + 3 + 1, 3)
+
+    # a list property in the vertex element is left to miniply
+    header = (
+        f"ply\nformat ascii 1.0\nelement vertex {len(vertex_rows)}\n"
+        + "".join(f"property float {c}\n" for c in "xyz")
+        + "property list uchar float weights\n"
+        + f"element face {len(face_rows)}\nproperty list uchar int vertex_indices\n"
+        + "end_header\n"
+    )
+    rows = [f"{row} 1 0.5" for row in vertex_rows] + face_rows
+    data = (header + "\n".join(rows) + "\n").encode()
+    assert load_ply_buffer(np.frombuffer(data, np.uint8)) is None
+    filename = str(tmpdir.join("fallback.ply"))
+    with open(filename, "wb") as fid:
+        fid.write(data)
+    for source in (data, filename):
+        for index_dtype in (np.int32, np.int64):
+            indices = pyminiply.read(source, index_dtype=index_dtype)[1]
+            assert np.array_equal(indices, expected)
+
+
+@pytest.mark.parametrize("token", ["1.2.3", "abc", "1e", "-", "1x", "nan", "0x10"])
+def test_read_ascii_malformed(token):
+    from pyminiply._wrapper import load_ply_buffer
+
+    data = _ascii_ply("float", [f"{token} 0 0", "0 0 0", "1 1 1"], ["3 0 1 2"])
+    # the direct decoder declines the file and miniply reports the error
+    assert load_ply_buffer(np.frombuffer(data, np.uint8)) is None
+    with pytest.raises(RuntimeError, match="Failed to load"):
+        pyminiply.read(data)
+
+    # integers do not accept a fraction
+    data = _ascii_ply("int", ["1.0 0 0", "0 0 0", "1 1 1"], ["3 0 1 2"])
+    assert load_ply_buffer(np.frombuffer(data, np.uint8)) is None